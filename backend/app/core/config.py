@@ -2,75 +2,199 @@
 Database configuration and settings
 """
 
-import os
-from sqlalchemy import create_engine, text
-from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
-from dotenv import load_dotenv
+import logging
+import time
+from contextlib import ExitStack
+from functools import lru_cache
+from typing import Any
 
-load_dotenv()
+import orjson
+from pydantic import Field
+from pydantic_settings import BaseSettings, SettingsConfigDict
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.orm import DeclarativeBase, sessionmaker
+
+logger = logging.getLogger(__name__)
 
 # Database configuration
-DATABASE_URL = "sqlite:///./ai_data_agent.db?mode=wal"  # Force SQLite for testing with WAL mode for concurrency
+DATABASE_PATH = "./ai_data_agent.db"
+DATABASE_URL = f"sqlite:///{DATABASE_PATH}?mode=wal"  # Force SQLite for testing with WAL mode for concurrency
+# Read-only URI connection to the same file; WAL lets these run alongside the writer
+READ_DATABASE_URL = f"sqlite:///file:{DATABASE_PATH}?mode=ro&uri=true"
+
+
+def _json_dumps(value: Any) -> str:
+    """Serialize JSON columns with orjson, which is several times faster than json.dumps"""
+    return orjson.dumps(value, option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS).decode()
+
+# Each write session checks out its own connection; SQLite still admits one writer at a
+# time, and BEGIN IMMEDIATE plus busy_timeout queue the rest instead of sharing a transaction
+WRITE_POOL_SIZE = 4
+WRITE_POOL_TIMEOUT_SECONDS = 30
 
-# Create engine with better connection management for SQLite
-from sqlalchemy.pool import StaticPool
-engine = create_engine(
+from sqlalchemy.pool import QueuePool
+write_engine = create_engine(
     DATABASE_URL,
     connect_args={
         "check_same_thread": False,
         "timeout": 20.0,  # Increase timeout for SQLite operations
     } if "sqlite" in DATABASE_URL else {},
-    poolclass=StaticPool if "sqlite" in DATABASE_URL else None,
+    poolclass=QueuePool,
+    pool_size=WRITE_POOL_SIZE,
+    max_overflow=0,
+    pool_timeout=WRITE_POOL_TIMEOUT_SECONDS,
     pool_pre_ping=True,
     pool_recycle=3600,  # Recycle connections after 1 hour
+    json_serializer=_json_dumps,
+    json_deserializer=orjson.loads,
     echo=False  # Set to True for debugging SQL
 )
 
-# Enable WAL mode for SQLite to handle concurrency
+# Reads are spread over a pool of read-only connections
+read_engine = create_engine(
+    READ_DATABASE_URL,
+    connect_args={"check_same_thread": False, "timeout": 20.0},
+    poolclass=QueuePool,
+    pool_size=8,
+    max_overflow=4,
+    pool_pre_ping=True,
+    pool_recycle=3600,
+    execution_options={"isolation_level": "AUTOCOMMIT"},
+    json_serializer=_json_dumps,
+    json_deserializer=orjson.loads,
+    echo=False
+)
+
+# Default engine used for DDL, uploads and anything that writes
+engine = write_engine
+
+# Per-connection SQLite tuning; pragmas reset on every new DBAPI connection
+SQLITE_CONNECTION_PRAGMAS = (
+    "PRAGMA synchronous=NORMAL;"
+    "PRAGMA busy_timeout=20000;"
+    "PRAGMA temp_store=MEMORY;"
+    "PRAGMA cache_size=-64000;"
+    "PRAGMA mmap_size=268435456;"
+    "PRAGMA foreign_keys=ON;"
+)
+
+# Minimum seconds between planner-statistics refreshes on a pooled connection
+SQLITE_OPTIMIZE_INTERVAL_SECONDS = 60
+
 if "sqlite" in DATABASE_URL:
-    with engine.connect() as conn:
-        conn.execute(text("PRAGMA journal_mode=WAL;"))
-        conn.commit()
+    @event.listens_for(write_engine, "connect")
+    def _set_sqlite_pragma(dbapi_conn, _):
+        """Enable WAL and apply the connection pragmas on each write connection"""
+        # Hand transaction control to SQLAlchemy so the begin hook below decides the mode
+        dbapi_conn.isolation_level = None
+        cursor = dbapi_conn.cursor()
+        cursor.executescript("PRAGMA journal_mode=WAL;" + SQLITE_CONNECTION_PRAGMAS)
+        # Cheap startup pass that only analyzes tables whose stats are missing or stale
+        cursor.execute("PRAGMA optimize=0x10002")
+        cursor.close()
+
+    @event.listens_for(write_engine, "checkin")
+    def _optimize_on_checkin(dbapi_conn, connection_record):
+        """Refresh planner statistics on long-lived write connections, at most once per interval"""
+        now = time.monotonic()
+        last_run = connection_record.info.get("last_optimize_at", now)
+        connection_record.info.setdefault("last_optimize_at", now)
+        if now - last_run < SQLITE_OPTIMIZE_INTERVAL_SECONDS:
+            return
+        connection_record.info["last_optimize_at"] = now
+        try:
+            dbapi_conn.execute("PRAGMA optimize")
+        except Exception as e:
+            logger.warning(f"PRAGMA optimize failed: {e}")
+
+    @event.listens_for(write_engine, "begin")
+    def _begin_immediate(conn):
+        """Take the write lock up front so concurrent read-to-write upgrades cannot deadlock"""
+        conn.exec_driver_sql("BEGIN IMMEDIATE")
+
+    @event.listens_for(read_engine, "connect")
+    def _set_sqlite_read_pragma(dbapi_conn, _):
+        """Apply the connection pragmas on read-only connections (journal mode is owned by the writer)"""
+        cursor = dbapi_conn.cursor()
+        cursor.executescript(SQLITE_CONNECTION_PRAGMAS)
+        cursor.close()
 
-# Create session factory
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# Create session factories
+SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=write_engine)
+ReadSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=read_engine)
+
+def warm_up_pools(read_connections: int) -> None:
+    """Open a write connection and up to read_connections readers ahead of traffic"""
+    with write_engine.connect() as conn:
+        conn.execute(text("SELECT 1"))
+
+    # Hold the readers open together so the pool keeps that many distinct connections
+    with ExitStack() as stack:
+        for _ in range(min(read_connections, read_engine.pool.size())):
+            conn = stack.enter_context(read_engine.connect())
+            conn.execute(text("SELECT 1"))
 
 # Create base class for models
-Base = declarative_base()
+class Base(DeclarativeBase):
+    """Declarative base for all ORM models"""
 
-# Database session dependency
-def get_db():
-    """Database session dependency for FastAPI"""
+# Database session dependencies
+def get_db_rw():
+    """Read-write database session dependency for FastAPI"""
     db = SessionLocal()
     try:
         yield db
     finally:
         db.close()
 
+# Kept as the default dependency so existing routes and overrides keep working
+get_db = get_db_rw
+
+def get_db_ro():
+    """Read-only database session dependency for FastAPI"""
+    db = ReadSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
 # Application settings
-class Settings:
-    """Application settings"""
+class Settings(BaseSettings):
+    """Application settings, read once from the environment and .env"""
+
+    model_config = SettingsConfigDict(env_file=".env", extra="ignore", populate_by_name=True)
 
     # File upload settings
-    MAX_FILE_SIZE_MB: int = int(os.getenv("MAX_FILE_SIZE_MB", "50"))
-    UPLOAD_DIR: str = os.getenv("UPLOAD_DIR", "uploads")
+    MAX_FILE_SIZE_MB: int = 50
+    UPLOAD_DIR: str = "uploads"
 
     # AI settings
-    GOOGLE_API_KEY: str = os.getenv("GOOGLE_API_KEY", "")
+    GOOGLE_API_KEY: str = ""
 
     # Auth settings
-    SECRET_KEY: str = os.getenv("SECRET_KEY", "change-me-secret")
-    ACCESS_TOKEN_EXPIRE_MINUTES: int = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "30"))
-    REFRESH_TOKEN_EXPIRE_DAYS: int = int(os.getenv("REFRESH_TOKEN_EXPIRE_DAYS", "7"))
-    TOKEN_ALGORITHM: str = os.getenv("TOKEN_ALGORITHM", "HS256")
+    SECRET_KEY: str = "change-me-secret"
+    ACCESS_TOKEN_EXPIRE_MINUTES: int = 30
+    REFRESH_TOKEN_EXPIRE_DAYS: int = 7
+    TOKEN_ALGORITHM: str = "HS256"
+
+    # Database settings
+    POOL_WARMUP: int = 4  # Read connections opened at startup
+
+    # Server settings
+    THREADPOOL_SIZE: int = 100  # Worker threads available to sync (def) route handlers
 
     # API settings
-    API_HOST: str = os.getenv("HOST", "0.0.0.0")
-    API_PORT: int = int(os.getenv("PORT", "8000"))
+    API_HOST: str = Field(default="0.0.0.0", validation_alias="HOST")
+    API_PORT: int = Field(default=8000, validation_alias="PORT")
 
     # CORS settings
-    FRONTEND_URL: str = os.getenv("FRONTEND_URL", "http://localhost:3000")
+    FRONTEND_URL: str = "http://localhost:3000"
+
+
+@lru_cache
+def get_settings() -> Settings:
+    """Return the process-wide settings instance"""
+    return Settings()
 
 # Global settings instance
-settings = Settings()
\ No newline at end of file
+settings = get_settings()
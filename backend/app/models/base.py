@@ -2,47 +2,70 @@
 Base database models for the AI Data Agent
 """
 
-from sqlalchemy import Column, Integer, String, DateTime, Text, Boolean, Float, JSON, ForeignKey
-from sqlalchemy.orm import relationship
-from sqlalchemy.sql import func
+from datetime import datetime
+from typing import Any, List, Optional
+
+from sqlalchemy import DDL, Integer, String, DateTime, Text, Boolean, Float, JSON, ForeignKey, Index, LargeBinary, event
+from sqlalchemy.orm import Mapped, mapped_column, relationship
+from sqlalchemy.sql import column, func, table
+from sqlalchemy.types import TypeDecorator
 from ..core.config import Base
 
+class FileDigest(TypeDecorator):
+    """Raw 32-byte file digest; hex strings are accepted on write and from legacy rows on read"""
+
+    impl = LargeBinary(32)
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        if isinstance(value, str):
+            return bytes.fromhex(value)
+        return value
+
+    def process_result_value(self, value, dialect):
+        # Rows saved before digests were stored raw still hold hex text
+        if isinstance(value, str):
+            return bytes.fromhex(value)
+        return value
+
+
 class UploadedFile(Base):
     """Model for tracking uploaded Excel files"""
 
     __tablename__ = "uploaded_files"
 
-    id = Column(Integer, primary_key=True, index=True)
-    filename = Column(String(255), nullable=False)
-    original_filename = Column(String(255), nullable=False)
-    file_path = Column(String(500), nullable=False)
-    file_size = Column(Integer, nullable=False)  # Size in bytes
-    file_hash = Column(String(64), nullable=False)  # For duplicate detection
-    mime_type = Column(String(100), nullable=False)
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, index=True)
+    filename: Mapped[str] = mapped_column(String(255), nullable=False)
+    original_filename: Mapped[str] = mapped_column(String(255), nullable=False)
+    file_path: Mapped[str] = mapped_column(String(500), nullable=False)
+    file_size: Mapped[int] = mapped_column(Integer, nullable=False)  # Size in bytes
+    file_hash: Mapped[bytes] = mapped_column(FileDigest, nullable=False, index=True)  # For duplicate detection
+    mime_type: Mapped[str] = mapped_column(String(100), nullable=False)
 
     # File processing status
-    status = Column(String(50), default="uploaded")  # uploaded, processing, completed, failed
-    error_message = Column(Text, nullable=True)
+    status: Mapped[Optional[str]] = mapped_column(String(50), default="uploaded")  # uploaded, processing, completed, failed
+    error_message: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
 
     # Metadata
-    total_sheets = Column(Integer, default=0)
-    total_rows = Column(Integer, default=0)
-    total_columns = Column(Integer, default=0)
+    total_sheets: Mapped[Optional[int]] = mapped_column(Integer, default=0)
+    total_rows: Mapped[Optional[int]] = mapped_column(Integer, default=0)
+    total_columns: Mapped[Optional[int]] = mapped_column(Integer, default=0)
 
     # Timestamps
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
-    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+    created_at: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True), server_default=func.now())
+    updated_at: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
 
     # Processing info
-    processed_at = Column(DateTime(timezone=True), nullable=True)
-    processing_time_seconds = Column(Float, nullable=True)
+    processed_at: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True), nullable=True)
+    processing_time_seconds: Mapped[Optional[float]] = mapped_column(Float, nullable=True)
 
     # Dynamic table and cleaning info
-    dynamic_table_name = Column(String(255), nullable=True)
-    sheet_names = Column(JSON, nullable=True)  # List of sheet names as JSON array
-    cleaning_metadata = Column(JSON, nullable=True)  # Per-sheet cleaning info
+    dynamic_table_name: Mapped[Optional[str]] = mapped_column(String(255), nullable=True)
+    # Deferred so lookups that only need the table name skip parsing large JSON blobs
+    sheet_names: Mapped[Optional[Any]] = mapped_column(JSON, nullable=True, deferred=True, deferred_group="file_metadata")  # List of sheet names as JSON array
+    cleaning_metadata: Mapped[Optional[Any]] = mapped_column(JSON, nullable=True, deferred=True, deferred_group="file_metadata")  # Per-sheet cleaning info
 
-    chat_sessions = relationship(
+    chat_sessions: Mapped[List["ChatSession"]] = relationship(
         "ChatSession",
         back_populates="file",
         cascade="all, delete-orphan",
@@ -53,130 +76,134 @@ class FileSheet(Base):
 
     __tablename__ = "file_sheets"
 
-    id = Column(Integer, primary_key=True, index=True)
-    file_id = Column(Integer, nullable=False, index=True)
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, index=True)
+    file_id: Mapped[int] = mapped_column(Integer, nullable=False, index=True)
 
     # Sheet information
-    sheet_name = Column(String(255), nullable=False)
-    table_name = Column(String(255), nullable=False, unique=True)  # Auto-generated table name
+    sheet_name: Mapped[str] = mapped_column(String(255), nullable=False)
+    table_name: Mapped[str] = mapped_column(String(255), nullable=False, unique=True)  # Auto-generated table name
 
     # Sheet metadata
-    row_count = Column(Integer, default=0)
-    column_count = Column(Integer, default=0)
-    header_row = Column(Integer, default=0)  # Row number containing headers
+    row_count: Mapped[Optional[int]] = mapped_column(Integer, default=0)
+    column_count: Mapped[Optional[int]] = mapped_column(Integer, default=0)
+    header_row: Mapped[Optional[int]] = mapped_column(Integer, default=0)  # Row number containing headers
 
     # Data quality
-    has_headers = Column(Boolean, default=True)
-    data_quality_score = Column(Float, nullable=True)  # 0-100 quality score
+    has_headers: Mapped[Optional[bool]] = mapped_column(Boolean, default=True)
+    data_quality_score: Mapped[Optional[float]] = mapped_column(Float, nullable=True)  # 0-100 quality score
 
     # Status
-    status = Column(String(50), default="pending")  # pending, processing, completed, failed
+    status: Mapped[Optional[str]] = mapped_column(String(50), default="pending")  # pending, processing, completed, failed
 
     # Timestamps
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
-    processed_at = Column(DateTime(timezone=True), nullable=True)
+    created_at: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True), server_default=func.now())
+    processed_at: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True), nullable=True)
 
 class SheetColumn(Base):
     """Model for tracking column metadata and data types"""
 
     __tablename__ = "sheet_columns"
 
-    id = Column(Integer, primary_key=True, index=True)
-    sheet_id = Column(Integer, nullable=False, index=True)
-    file_id = Column(Integer, nullable=False, index=True)
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, index=True)
+    sheet_id: Mapped[int] = mapped_column(Integer, nullable=False, index=True)
+    file_id: Mapped[int] = mapped_column(Integer, nullable=False, index=True)
 
     # Column information
-    column_name = Column(String(255), nullable=False)
-    original_column_name = Column(String(255), nullable=True)  # Before cleaning
-    column_index = Column(Integer, nullable=False)  # Position in sheet
+    column_name: Mapped[str] = mapped_column(String(255), nullable=False)
+    original_column_name: Mapped[Optional[str]] = mapped_column(String(255), nullable=True)  # Before cleaning
+    column_index: Mapped[int] = mapped_column(Integer, nullable=False)  # Position in sheet
 
     # Data type detection
-    detected_data_type = Column(String(50), nullable=False)  # string, integer, float, date, boolean
-    confidence_score = Column(Float, nullable=True)  # How confident we are in the data type
+    detected_data_type: Mapped[str] = mapped_column(String(50), nullable=False)  # string, integer, float, date, boolean
+    confidence_score: Mapped[Optional[float]] = mapped_column(Float, nullable=True)  # How confident we are in the data type
 
     # Data characteristics
-    is_nullable = Column(Boolean, default=True)
-    unique_values_count = Column(Integer, default=0)
-    null_values_count = Column(Integer, default=0)
+    is_nullable: Mapped[Optional[bool]] = mapped_column(Boolean, default=True)
+    unique_values_count: Mapped[Optional[int]] = mapped_column(Integer, default=0)
+    null_values_count: Mapped[Optional[int]] = mapped_column(Integer, default=0)
 
     # String-specific metadata
-    max_length = Column(Integer, nullable=True)
-    avg_length = Column(Float, nullable=True)
+    max_length: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)
+    avg_length: Mapped[Optional[float]] = mapped_column(Float, nullable=True)
 
     # Numeric-specific metadata
-    min_value = Column(Float, nullable=True)
-    max_value = Column(Float, nullable=True)
-    avg_value = Column(Float, nullable=True)
-    std_deviation = Column(Float, nullable=True)
+    min_value: Mapped[Optional[float]] = mapped_column(Float, nullable=True)
+    max_value: Mapped[Optional[float]] = mapped_column(Float, nullable=True)
+    avg_value: Mapped[Optional[float]] = mapped_column(Float, nullable=True)
+    std_deviation: Mapped[Optional[float]] = mapped_column(Float, nullable=True)
 
     # Date-specific metadata
-    earliest_date = Column(DateTime(timezone=True), nullable=True)
-    latest_date = Column(DateTime(timezone=True), nullable=True)
+    earliest_date: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True), nullable=True)
+    latest_date: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True), nullable=True)
 
     # Data quality flags
-    has_inconsistent_types = Column(Boolean, default=False)
-    has_outliers = Column(Boolean, default=False)
-    needs_cleaning = Column(Boolean, default=False)
+    has_inconsistent_types: Mapped[Optional[bool]] = mapped_column(Boolean, default=False)
+    has_outliers: Mapped[Optional[bool]] = mapped_column(Boolean, default=False)
+    needs_cleaning: Mapped[Optional[bool]] = mapped_column(Boolean, default=False)
 
     # Processing
-    cleaning_applied = Column(JSON, nullable=True)  # Track what cleaning was done
+    cleaning_applied: Mapped[Optional[Any]] = mapped_column(JSON, nullable=True, deferred=True)  # Track what cleaning was done
 
 class DataQualityIssue(Base):
     """Model for tracking data quality issues"""
 
     __tablename__ = "data_quality_issues"
 
-    id = Column(Integer, primary_key=True, index=True)
-    file_id = Column(Integer, nullable=False, index=True)
-    sheet_id = Column(Integer, nullable=True, index=True)
-    column_id = Column(Integer, nullable=True, index=True)
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, index=True)
+    file_id: Mapped[int] = mapped_column(Integer, nullable=False, index=True)
+    sheet_id: Mapped[Optional[int]] = mapped_column(Integer, nullable=True, index=True)
+    column_id: Mapped[Optional[int]] = mapped_column(Integer, nullable=True, index=True)
 
     # Issue details
-    issue_type = Column(String(100), nullable=False)  # missing_values, inconsistent_types, outliers, etc.
-    severity = Column(String(20), nullable=False)  # low, medium, high, critical
-    description = Column(Text, nullable=False)
+    issue_type: Mapped[str] = mapped_column(String(100), nullable=False)  # missing_values, inconsistent_types, outliers, etc.
+    severity: Mapped[str] = mapped_column(String(20), nullable=False)  # low, medium, high, critical
+    description: Mapped[str] = mapped_column(Text, nullable=False)
 
     # Location
-    row_number = Column(Integer, nullable=True)
-    column_name = Column(String(255), nullable=True)
+    row_number: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)
+    column_name: Mapped[Optional[str]] = mapped_column(String(255), nullable=True)
 
     # Resolution
-    resolved = Column(Boolean, default=False)
-    resolution_notes = Column(Text, nullable=True)
-    resolved_at = Column(DateTime(timezone=True), nullable=True)
+    resolved: Mapped[Optional[bool]] = mapped_column(Boolean, default=False)
+    resolution_notes: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
+    resolved_at: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True), nullable=True)
 
     # Timestamps
-    detected_at = Column(DateTime(timezone=True), server_default=func.now())
+    detected_at: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True), server_default=func.now())
 
 class QueryHistory(Base):
     """Model for tracking user queries and responses"""
 
     __tablename__ = "query_history"
+    __table_args__ = (
+        # Serves per-file history listings newest-first without a separate sort
+        Index("ix_query_history_file_created", "file_id", "created_at"),
+    )
 
-    id = Column(Integer, primary_key=True, index=True)
-    file_id = Column(Integer, nullable=False, index=True)
-    session_id = Column(Integer, ForeignKey("chat_sessions.id"), nullable=True, index=True)
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, index=True)
+    file_id: Mapped[int] = mapped_column(Integer, nullable=False, index=True)
+    session_id: Mapped[Optional[int]] = mapped_column(Integer, ForeignKey("chat_sessions.id"), nullable=True, index=True)
 
     # Query details
-    natural_language_query = Column(Text, nullable=False)
-    processed_query = Column(Text, nullable=True)  # AI-processed version
-    sql_query = Column(Text, nullable=True)  # Generated SQL
+    natural_language_query: Mapped[str] = mapped_column(Text, nullable=False)
+    processed_query: Mapped[Optional[str]] = mapped_column(Text, nullable=True)  # AI-processed version
+    sql_query: Mapped[Optional[str]] = mapped_column(Text, nullable=True)  # Generated SQL
 
     # Response
-    response_text = Column(Text, nullable=True)
-    visualization_type = Column(String(50), nullable=True)  # chart, table, pivot
-    visualization_config = Column(JSON, nullable=True)
+    response_text: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
+    visualization_type: Mapped[Optional[str]] = mapped_column(String(50), nullable=True)  # chart, table, pivot
+    visualization_config: Mapped[Optional[Any]] = mapped_column(JSON, nullable=True, deferred=True)
 
     # Metadata
-    execution_time_ms = Column(Float, nullable=True)
-    rows_returned = Column(Integer, nullable=True)
-    status = Column(String(50), default="completed")  # completed, failed, timeout
+    execution_time_ms: Mapped[Optional[float]] = mapped_column(Float, nullable=True)
+    rows_returned: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)
+    status: Mapped[Optional[str]] = mapped_column(String(50), default="completed")  # completed, failed, timeout
 
     # Timestamps
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
-    executed_at = Column(DateTime(timezone=True), nullable=True)
+    created_at: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True), server_default=func.now())
+    executed_at: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True), nullable=True)
 
-    session = relationship("ChatSession", back_populates="query_history")
+    session: Mapped[Optional["ChatSession"]] = relationship("ChatSession", back_populates="query_history")
 
 
 
@@ -192,39 +219,83 @@ class ChatSession(Base):
     """Persistent AI chat sessions for users"""
 
     __tablename__ = "chat_sessions"
-
-    id = Column(Integer, primary_key=True, index=True)
-    user_id = Column(Integer, nullable=False, default=1)  # Default to anonymous user
-    file_id = Column(Integer, ForeignKey("uploaded_files.id"), nullable=True, index=True)
-    title = Column(String(255), nullable=False, default="New conversation")
-    summary = Column(Text, nullable=True)
-    is_archived = Column(Boolean, default=False)
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
-    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
-    last_interaction_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
-
-    file = relationship("UploadedFile", back_populates="chat_sessions")
-    messages = relationship(
+    __table_args__ = (
+        # The sidebar lists unarchived sessions newest first straight from this index, without a sort
+        Index("ix_chat_sessions_archived_updated", "is_archived", "updated_at"),
+    )
+    # Fetch server-side timestamps with RETURNING on flush instead of a follow-up SELECT
+    __mapper_args__ = {"eager_defaults": True}
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, index=True)
+    user_id: Mapped[int] = mapped_column(Integer, nullable=False, default=1)  # Default to anonymous user
+    file_id: Mapped[Optional[int]] = mapped_column(Integer, ForeignKey("uploaded_files.id"), nullable=True, index=True)
+    title: Mapped[str] = mapped_column(String(255), nullable=False, default="New conversation")
+    summary: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
+    is_archived: Mapped[Optional[bool]] = mapped_column(Boolean, default=False)
+    # Denormalized list stats kept up to date by ChatService; NULL means not yet backfilled
+    message_count: Mapped[Optional[int]] = mapped_column(Integer, default=0, nullable=True)
+    assistant_preview: Mapped[Optional[str]] = mapped_column(String(101), nullable=True)  # Prefix of the latest assistant reply
+    created_at: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True), server_default=func.now())
+    updated_at: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+    last_interaction_at: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+    file: Mapped[Optional["UploadedFile"]] = relationship("UploadedFile", back_populates="chat_sessions")
+    messages: Mapped[List["ChatMessage"]] = relationship(
         "ChatMessage",
         back_populates="session",
         order_by="ChatMessage.created_at",
         cascade="all, delete-orphan",
     )
-    query_history = relationship("QueryHistory", back_populates="session")
+    query_history: Mapped[List["QueryHistory"]] = relationship("QueryHistory", back_populates="session")
 
 
 class ChatMessage(Base):
     """Messages exchanged within a chat session"""
 
     __tablename__ = "chat_messages"
+    __table_args__ = (
+        # Serves chronological message pages for a session straight from the index
+        Index("ix_chat_messages_session_created", "session_id", "created_at"),
+        # Latest-assistant previews seek straight to (session_id, 'assistant') newest-first
+        Index("ix_chat_messages_session_role_created", "session_id", "role", "created_at"),
+    )
 
-    id = Column(Integer, primary_key=True, index=True)
-    session_id = Column(Integer, ForeignKey("chat_sessions.id"), nullable=False, index=True)
-    user_id = Column(Integer, nullable=True)  # Optional for anonymous users
-    role = Column(String(20), nullable=False)  # user, assistant, system
-    content = Column(Text, nullable=False)
-    sql_query = Column(Text, nullable=True)
-    payload = Column(JSON, nullable=True)
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
-
-    session = relationship("ChatSession", back_populates="messages")
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, index=True)
+    session_id: Mapped[int] = mapped_column(Integer, ForeignKey("chat_sessions.id"), nullable=False, index=True)
+    user_id: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)  # Optional for anonymous users
+    role: Mapped[str] = mapped_column(String(20), nullable=False)  # user, assistant, system
+    content: Mapped[str] = mapped_column(Text, nullable=False)
+    sql_query: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
+    payload: Mapped[Optional[Any]] = mapped_column(JSON, nullable=True)
+    created_at: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True), server_default=func.now())
+
+    session: Mapped["ChatSession"] = relationship("ChatSession", back_populates="messages")
+
+
+# Trigram full-text index over message text, kept in sync by triggers, so substring search
+# is answered from the index instead of scanning every message with LIKE '%q%'
+CHAT_MESSAGE_SEARCH_DDL = (
+    """CREATE VIRTUAL TABLE IF NOT EXISTS chat_messages_fts USING fts5(
+        content, sql_query, content='chat_messages', content_rowid='id', tokenize='trigram'
+    )""",
+    """CREATE TRIGGER IF NOT EXISTS chat_messages_fts_ai AFTER INSERT ON chat_messages BEGIN
+        INSERT INTO chat_messages_fts(rowid, content, sql_query) VALUES (new.id, new.content, new.sql_query);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS chat_messages_fts_ad AFTER DELETE ON chat_messages BEGIN
+        INSERT INTO chat_messages_fts(chat_messages_fts, rowid, content, sql_query)
+        VALUES ('delete', old.id, old.content, old.sql_query);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS chat_messages_fts_au AFTER UPDATE OF content, sql_query ON chat_messages BEGIN
+        INSERT INTO chat_messages_fts(chat_messages_fts, rowid, content, sql_query)
+        VALUES ('delete', old.id, old.content, old.sql_query);
+        INSERT INTO chat_messages_fts(rowid, content, sql_query) VALUES (new.id, new.content, new.sql_query);
+    END""",
+    # Re-index from chat_messages, which also clears entries left over from a dropped table
+    "INSERT INTO chat_messages_fts(chat_messages_fts) VALUES ('rebuild')",
+)
+
+for _statement in CHAT_MESSAGE_SEARCH_DDL:
+    event.listen(ChatMessage.__table__, "after_create", DDL(_statement).execute_if(dialect="sqlite"))
+
+# Lightweight handle on the FTS table for building MATCH queries
+chat_messages_fts = table("chat_messages_fts", column("rowid"), column("chat_messages_fts"))
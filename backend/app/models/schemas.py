@@ -4,7 +4,7 @@ Pydantic schemas for API request/response validation
 
 from __future__ import annotations
 
-from pydantic import BaseModel, Field, EmailStr
+from pydantic import BaseModel, ConfigDict, Field, EmailStr
 from typing import List, Optional, Dict, Any, Literal
 from datetime import datetime
 from enum import Enum
@@ -221,19 +221,30 @@ class CleanedDataMetadata(BaseModel):
 # AI Query Models
 class AIQueryRequest(BaseModel):
     """Request schema for AI-powered queries"""
-    query: str = Field(..., min_length=1)
+    query: str = ""  # Emptiness is reported by the endpoints as a 400
     file_id: Optional[int] = None
     context: Optional[str] = None
     session_id: Optional[int] = None
     session_title: Optional[str] = None
 
+class SendMessageRequest(AIQueryRequest):
+    """Request schema for sending a chat message"""
+
+class ExecuteSQLRequest(BaseModel):
+    """Request schema for executing SQL against a file's dynamic table"""
+    file_id: Optional[int] = None
+    sql_query: Optional[str] = None
+    stream: bool = False  # Return NDJSON chunks instead of a single JSON document
+
 class AIQueryResponse(BaseModel):
     """Response schema for AI query execution"""
+    model_config = ConfigDict(extra="ignore", frozen=True)
+
     status: str
     query: str
     sql_query: Optional[str] = None
     executed_results: Optional[Dict[str, Any]] = None
-    visualizations: Optional[List[Dict[str, Any]]] = Field(None, max_items=3)
+    visualizations: Optional[List[Dict[str, Any]]] = Field(default=None, max_length=3)
     explanation: Optional[str] = None
     data_quality_disclaimer: Optional[str] = None
     error: Optional[str] = None
@@ -264,6 +275,8 @@ class ChatMessageCreate(BaseModel):
 
 
 class ChatMessageResponse(BaseModel):
+    model_config = ConfigDict(from_attributes=True, extra="ignore", frozen=True)
+
     id: int
     session_id: int
     role: str
@@ -272,11 +285,10 @@ class ChatMessageResponse(BaseModel):
     payload: Optional[Dict[str, Any]]
     created_at: datetime
 
-    class Config:
-        from_attributes = True
-
 
 class ChatSessionSummary(BaseModel):
+    model_config = ConfigDict(from_attributes=True, extra="ignore", frozen=True)
+
     id: int
     title: str
     summary: Optional[str]
@@ -290,16 +302,31 @@ class ChatSessionSummary(BaseModel):
 
 
 class ChatSessionResponse(BaseModel):
+    model_config = ConfigDict(extra="ignore", frozen=True)
+
     session: ChatSessionSummary
 
 
+class CreateSessionResponse(ChatSessionResponse):
+    """Response schema for creating a chat session"""
+
+
+class SendMessageResponse(AIQueryResponse):
+    """Response schema for a chat turn, including the stored user and assistant messages"""
+
+
 class ChatSessionListResponse(BaseModel):
+    model_config = ConfigDict(extra="ignore", frozen=True)
+
     sessions: List[ChatSessionSummary]
 
 
 class ChatMessageListResponse(BaseModel):
+    model_config = ConfigDict(extra="ignore", frozen=True)
+
     session_id: int
     messages: List[ChatMessageResponse]
+    next_cursor: Optional[str] = None
 
 # Health Check Schema
 class HealthCheckResponse(BaseModel):
@@ -2,31 +2,233 @@
 AI-powered query processing router
 """
 
-from fastapi import APIRouter, HTTPException, Depends
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+import orjson
+import pandas as pd
+from fastapi import APIRouter, HTTPException, Depends, Request
+from fastapi.responses import ORJSONResponse, Response, StreamingResponse
+from sqlalchemy import bindparam, select
 from sqlalchemy.orm import Session
-from typing import Dict, Any
-from ..core.config import get_db
+from ..core.config import get_db_ro
 from ..models.base import UploadedFile as UploadedFileModel
+from ..models.schemas import AIQueryRequest, ExecuteSQLRequest
 from ..services.gemini_service import get_gemini_service
+from ..utils.database import execute_sql
 
 router = APIRouter(prefix="/ai", tags=["AI Queries"])
 
+# Rows fetched per DataFrame chunk when streaming results as NDJSON
+STREAM_CHUNK_SIZE = 10_000
+
+
+# Built once at import; SQLAlchemy's compiled cache then reuses the SQL string for every lookup
+_TABLE_NAME_STMT = (
+    select(UploadedFileModel.id, UploadedFileModel.dynamic_table_name)
+    .where(UploadedFileModel.id == bindparam("fid"))
+)
+
+# Resolved dynamic table names per file_id; names never change once a file is processed
+TABLE_NAME_CACHE_SIZE = 2048
+_table_name_cache: "OrderedDict[int, str]" = OrderedDict()
+_table_name_cache_lock = threading.Lock()
+
+
+# Completed AI responses (generate-sql and chat turns) keyed by ETag, stored with their file_id for
+# invalidation and the time they were cached; entries expire so retries eventually reach the model again
+GENERATED_SQL_CACHE_SIZE = 512
+GENERATED_SQL_CACHE_TTL_SECONDS = 3600
+_generated_sql_cache: "OrderedDict[str, Tuple[int, float, Dict[str, Any]]]" = OrderedDict()
+_generated_sql_cache_lock = threading.Lock()
+
+
+def clear_table_name_cache(file_id: Optional[int] = None) -> None:
+    """Drop one cached table name, or all of them when no file_id is given"""
+    with _table_name_cache_lock:
+        if file_id is None:
+            _table_name_cache.clear()
+        else:
+            _table_name_cache.pop(file_id, None)
+
+
+def clear_generated_sql_cache(file_id: Optional[int] = None) -> None:
+    """Drop cached AI responses for one file, or all of them when no file_id is given"""
+    with _generated_sql_cache_lock:
+        if file_id is None:
+            _generated_sql_cache.clear()
+            return
+        for etag in [key for key, (cached_id, _, _) in _generated_sql_cache.items() if cached_id == file_id]:
+            del _generated_sql_cache[etag]
+
+
+def normalize_query(query: str) -> str:
+    """Collapse whitespace and trailing punctuation so trivially different phrasings share a cache entry"""
+    # Case is kept: quoted values in a question end up in the SQL, and SQLite compares them case-sensitively
+    return " ".join(query.split()).rstrip("?.! ")
+
+
+def ai_response_cache_key(file_id: int, table_name: str, query: str, context: Optional[Any] = None) -> str:
+    """Derive a quoted ETag from everything the AI response depends on"""
+    key = orjson.dumps([file_id, table_name, normalize_query(query), context], option=orjson.OPT_SORT_KEYS)
+    return f'"{hashlib.blake2b(key, digest_size=8).hexdigest()}"'
+
+
+def get_cached_ai_response(key: str) -> Optional[Dict[str, Any]]:
+    """Return a cached AI response and mark it recently used, or None on a miss"""
+    with _generated_sql_cache_lock:
+        cached = _generated_sql_cache.get(key)
+        if cached is None:
+            return None
+        if time.monotonic() - cached[1] > GENERATED_SQL_CACHE_TTL_SECONDS:
+            del _generated_sql_cache[key]
+            return None
+        _generated_sql_cache.move_to_end(key)
+        return cached[2]
+
+
+def cache_ai_response(key: str, file_id: int, result: Dict[str, Any]) -> None:
+    """Store a completed AI response; errors are not cached so a retry goes back to the model"""
+    if result.get("status") != "completed":
+        return
+    with _generated_sql_cache_lock:
+        _generated_sql_cache[key] = (file_id, time.monotonic(), result)
+        if len(_generated_sql_cache) > GENERATED_SQL_CACHE_SIZE:
+            _generated_sql_cache.popitem(last=False)
+
+
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Check an If-None-Match header, which may list several (possibly weak) tags"""
+    if not if_none_match:
+        return False
+    candidates = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+    return etag in candidates or "*" in candidates
+
+
+def warm_table_name_cache(db: Session, limit: int = 256) -> int:
+    """Preload table names for the most recently updated files, returning how many were cached"""
+    rows = db.execute(
+        select(UploadedFileModel.id, UploadedFileModel.dynamic_table_name)
+        .where(UploadedFileModel.dynamic_table_name.is_not(None))
+        .order_by(UploadedFileModel.updated_at.desc())
+        .limit(min(limit, TABLE_NAME_CACHE_SIZE))
+    ).all()
+    with _table_name_cache_lock:
+        # Oldest first so the most recent files end up at the hot end of the LRU
+        for row in reversed(rows):
+            _table_name_cache[row.id] = row.dynamic_table_name
+    return len(rows)
+
+
+def get_dynamic_table_name(db: Session, file_id: int) -> str:
+    """Resolve a file's dynamic table name, hitting the database only on a cache miss"""
+    with _table_name_cache_lock:
+        table_name = _table_name_cache.get(file_id)
+        if table_name is not None:
+            _table_name_cache.move_to_end(file_id)
+            return table_name
+
+    row = db.execute(_TABLE_NAME_STMT, {"fid": file_id}).first()
+    if row is None:
+        raise HTTPException(status_code=404, detail="File not found")
+
+    if not row.dynamic_table_name:
+        raise HTTPException(status_code=400, detail="File does not have a dynamic table")
+
+    # Only completed lookups are cached so unprocessed files are re-checked next time
+    with _table_name_cache_lock:
+        _table_name_cache[file_id] = row.dynamic_table_name
+        if len(_table_name_cache) > TABLE_NAME_CACHE_SIZE:
+            _table_name_cache.popitem(last=False)
+
+    return row.dynamic_table_name
+
+
+def _release_connection(db: Session) -> None:
+    """
+    Return the session's pooled connection before a slow model call
+
+    The AI service runs its own queries through db.bind, so the request session
+    would otherwise pin a read connection for the whole round trip to Gemini.
+    """
+    db.close()
+
+
+def _dataframe_response(result_df: pd.DataFrame) -> Response:
+    """Encode query results as JSON without building a Python dict per row"""
+    columns = [{"name": col, "type": str(dtype)} for col, dtype in result_df.dtypes.items()]
+    # pandas' C encoder writes the records array; orjson handles the small envelope
+    records = result_df.to_json(orient="records", date_format="iso").encode()
+    body = b"".join((
+        b'{"status":"success","data":',
+        records,
+        b',"columns":',
+        orjson.dumps(columns),
+        b',"row_count":',
+        str(len(result_df)).encode(),
+        b"}",
+    ))
+    return Response(content=body, media_type="application/json")
+
+
+def _ndjson_stream(chunks: Iterator[pd.DataFrame]) -> Iterator[bytes]:
+    """
+    Yield query results as NDJSON: a columns header, one object per row, then a status trailer
+
+    The first chunk is pulled eagerly so SQL errors surface as a normal 500 before streaming starts.
+    """
+    first_chunk = next(chunks, None)
+    columns = (
+        [{"name": col, "type": str(dtype)} for col, dtype in first_chunk.dtypes.items()]
+        if first_chunk is not None
+        else []
+    )
+
+    def generate() -> Iterator[bytes]:
+        row_count = 0
+        yield orjson.dumps({"columns": columns}) + b"\n"
+        try:
+            chunk = first_chunk
+            while chunk is not None:
+                if len(chunk):
+                    yield chunk.to_json(orient="records", lines=True, date_format="iso").encode().rstrip(b"\n") + b"\n"
+                    row_count += len(chunk)
+                chunk = next(chunks, None)
+        except Exception as e:
+            # Headers are already sent, so report the failure in-band
+            yield orjson.dumps({"status": "error", "error": str(e), "row_count": row_count}) + b"\n"
+            return
+        yield orjson.dumps({"status": "success", "row_count": row_count}) + b"\n"
+
+    return generate()
+
+
 @router.post("/generate-sql")
-async def generate_sql(request: Dict[str, Any], db: Session = Depends(get_db)):
+def generate_sql(
+    request: AIQueryRequest,
+    http_request: Request,
+    db: Session = Depends(get_db_ro),
+):
     """
     Generate SQL from natural language query
 
+    Repeat requests for the same file, query and context are served from an LRU
+    and answer 304 when the client already holds the matching ETag.
+
     Args:
-        request: Dictionary containing query, file_id, context
-        db: Database session
+        request: AI query request with query, file_id and context
+        http_request: Incoming request, read for If-None-Match
+        db: Read-only database session
 
     Returns:
         AI-generated SQL and analysis
     """
     try:
-        query_text = request.get("query", "")
-        file_id = request.get("file_id")
-        context = request.get("context")
+        query_text = request.query
+        file_id = request.file_id
 
         if not query_text:
             raise HTTPException(status_code=400, detail="Query cannot be empty")
@@ -34,19 +236,26 @@ async def generate_sql(request: Dict[str, Any], db: Session = Depends(get_db)):
         if not file_id:
             raise HTTPException(status_code=400, detail="file_id is required")
 
-        # Get file from database
-        file = db.query(UploadedFileModel).filter(UploadedFileModel.id == file_id).first()
-        if not file:
-            raise HTTPException(status_code=404, detail="File not found")
+        table_name = get_dynamic_table_name(db, file_id)
+        etag = ai_response_cache_key(file_id, table_name, query_text, request.context)
+
+        cached = get_cached_ai_response(etag)
+        if cached is not None:
+            if _etag_matches(http_request.headers.get("if-none-match"), etag):
+                return Response(status_code=304, headers={"ETag": etag})
+            return ORJSONResponse(cached, headers={"ETag": etag})
 
-        if not file.dynamic_table_name:
-            raise HTTPException(status_code=400, detail="File does not have a dynamic table")
+        _release_connection(db)
 
         # Get Gemini service and execute AI query
         gemini_service = get_gemini_service()
-        result = gemini_service.execute_ai_query(request, file.dynamic_table_name, db.bind)
+        result = gemini_service.execute_ai_query(request.model_dump(), table_name, db.bind)
 
-        return result
+        cache_ai_response(etag, file_id, result)
+        headers = {"ETag": etag} if result.get("status") == "completed" else None
+
+        # Encode here, in the worker thread; a returned dict would be encoded on the event loop
+        return ORJSONResponse(result, headers=headers)
 
     except HTTPException:
         raise
@@ -54,42 +263,34 @@ async def generate_sql(request: Dict[str, Any], db: Session = Depends(get_db)):
         raise HTTPException(status_code=500, detail=f"SQL generation failed: {str(e)}")
 
 @router.post("/execute-sql")
-async def execute_sql_endpoint(request: Dict[str, Any], db: Session = Depends(get_db)):
+def execute_sql_endpoint(request: ExecuteSQLRequest, db: Session = Depends(get_db_ro)):
     """
     Execute SQL query on dynamic table
 
     Args:
-        request: Dictionary with file_id and sql_query
-        db: Database session
+        request: SQL execution request with file_id, sql_query and optional stream flag
+        db: Read-only database session
 
     Returns:
-        Query execution results
+        Query execution results, or an NDJSON stream when stream is set
     """
     try:
-        file_id = request.get("file_id")
-        sql_query = request.get("sql_query")
+        file_id = request.file_id
+        sql_query = request.sql_query
 
         if not file_id or not sql_query:
             raise HTTPException(status_code=400, detail="file_id and sql_query are required")
 
-        # Get file from database
-        file = db.query(UploadedFileModel).filter(UploadedFileModel.id == file_id).first()
-        if not file:
-            raise HTTPException(status_code=404, detail="File not found")
-
-        if not file.dynamic_table_name:
-            raise HTTPException(status_code=400, detail="File does not have a dynamic table")
+        table_name = get_dynamic_table_name(db, file_id)
 
         # Execute SQL
-        from ..utils.database import execute_sql
-        result_df = execute_sql(file.dynamic_table_name, sql_query, db.bind)
+        if request.stream:
+            chunks = execute_sql(table_name, sql_query, db.bind, chunksize=STREAM_CHUNK_SIZE)
+            return StreamingResponse(_ndjson_stream(iter(chunks)), media_type="application/x-ndjson")
+
+        result_df = execute_sql(table_name, sql_query, db.bind)
 
-        return {
-            "status": "success",
-            "data": result_df.to_dict('records'),
-            "columns": [{'name': col, 'type': str(result_df[col].dtype)} for col in result_df.columns],
-            "row_count": len(result_df)
-        }
+        return _dataframe_response(result_df)
 
     except HTTPException:
         raise
@@ -97,21 +298,20 @@ async def execute_sql_endpoint(request: Dict[str, Any], db: Session = Depends(ge
         raise HTTPException(status_code=500, detail=f"SQL execution failed: {str(e)}")
 
 @router.post("/query")
-async def ai_query_endpoint(request: Dict[str, Any], db: Session = Depends(get_db)):
+def ai_query_endpoint(request: AIQueryRequest, db: Session = Depends(get_db_ro)):
     """
     Execute AI-powered natural language query with full pipeline
 
     Args:
-        request: Dictionary containing query, file_id, context
-        db: Database session
+        request: AI query request with query, file_id and context
+        db: Read-only database session
 
     Returns:
         Complete AI query results with visualizations
     """
     try:
-        query_text = request.get("query", "")
-        file_id = request.get("file_id")
-        context = request.get("context")
+        query_text = request.query
+        file_id = request.file_id
 
         if not query_text:
             raise HTTPException(status_code=400, detail="Query cannot be empty")
@@ -119,19 +319,21 @@ async def ai_query_endpoint(request: Dict[str, Any], db: Session = Depends(get_d
         if not file_id:
             raise HTTPException(status_code=400, detail="file_id is required")
 
-        # Get file from database
-        file = db.query(UploadedFileModel).filter(UploadedFileModel.id == file_id).first()
-        if not file:
-            raise HTTPException(status_code=404, detail="File not found")
+        table_name = get_dynamic_table_name(db, file_id)
+        cache_key = ai_response_cache_key(file_id, table_name, query_text, request.context)
+        cached = get_cached_ai_response(cache_key)
+        if cached is not None:
+            return ORJSONResponse(cached)
 
-        if not file.dynamic_table_name:
-            raise HTTPException(status_code=400, detail="File does not have a dynamic table")
+        _release_connection(db)
 
         # Get Gemini service and execute AI query
         gemini_service = get_gemini_service()
-        result = gemini_service.execute_ai_query(request, file.dynamic_table_name, db.bind)
+        result = gemini_service.execute_ai_query(request.model_dump(), table_name, db.bind)
+        cache_ai_response(cache_key, file_id, result)
 
-        return result
+        # Encode here, in the worker thread; a returned dict would be encoded on the event loop
+        return ORJSONResponse(result)
 
     except HTTPException:
         raise
@@ -1,30 +1,40 @@
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, Iterator, Tuple
+import base64
+import re
 from datetime import datetime
 
-from fastapi import APIRouter, Depends, HTTPException, Query, status
-from sqlalchemy.orm import Session
-from sqlalchemy import or_, and_, text
+import orjson
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import ORJSONResponse, Response, StreamingResponse
+from sqlalchemy.orm import Session, joinedload, raiseload
+from sqlalchemy import func, select
 
-from ..core.config import get_db
-from ..models.base import ChatMessage, ChatSession
+from ..core.config import get_db, get_db_ro, read_engine
+from ..models.base import ChatMessage, ChatSession, UploadedFile
 from ..models.schemas import (
-    ChatMessageCreate,
     ChatMessageListResponse,
     ChatMessageResponse,
     ChatSessionCreate,
     ChatSessionListResponse,
     ChatSessionResponse,
     ChatSessionSummary,
-    ChatSessionUpdate,
+    CreateSessionResponse,
+    SendMessageRequest,
+    SendMessageResponse,
 )
 from ..services import chat_service
 from ..services.gemini_service import get_gemini_service
+from .ai import ai_response_cache_key, cache_ai_response, get_cached_ai_response, get_dynamic_table_name
 
-router = APIRouter(prefix="/chat", tags=["Chat"])
+router = APIRouter(prefix="/chat", tags=["Chat"], default_response_class=ORJSONResponse)
+
+# Maximum number of messages included in a session export
+EXPORT_MESSAGE_LIMIT = 1000
 
 
 def _serialize_session(summary_source: ChatSession, message_count: int, assistant_preview: Optional[str]) -> ChatSessionSummary:
-    return ChatSessionSummary(
+    # Values come from our own rows, so build the summary without re-validating every field
+    return ChatSessionSummary.model_construct(
         id=summary_source.id,
         title=summary_source.title,
         summary=summary_source.summary,
@@ -38,265 +48,392 @@ def _serialize_session(summary_source: ChatSession, message_count: int, assistan
     )
 
 
-@router.get("/sessions", response_model=ChatSessionListResponse)
+def _format_preview(content: Optional[str]) -> Optional[str]:
+    """Shorten assistant content to the 100-character preview shown in session lists"""
+    if content is not None and len(content) > 100:
+        return content[:100] + "..."
+    return content
+
+
+def _encode_message_cursor(message: ChatMessage, forward: bool = False) -> str:
+    """Pack a message's (created_at, id) keyset position into an opaque URL-safe cursor that pages older, or newer when forward"""
+    position = [message.created_at, message.id]
+    if forward:
+        position.append("after")
+    return base64.urlsafe_b64encode(orjson.dumps(position)).decode()
+
+
+def _decode_message_cursor(cursor: str) -> Tuple[datetime, int, bool]:
+    """Unpack a cursor from _encode_message_cursor into (created_at, id, forward), answering 400 when it is malformed"""
+    try:
+        created_at, message_id, *direction = orjson.loads(base64.urlsafe_b64decode(cursor))
+        if direction not in ([], ["after"]):
+            raise ValueError("Unknown cursor direction")
+        return datetime.fromisoformat(created_at), int(message_id), bool(direction)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def get_chat_session(session_id: int, db: Session = Depends(get_db)) -> ChatSession:
+    """Resolve the path's chat session once per request, answering 404 when it does not exist"""
+    try:
+        return chat_service.get_session(db, session_id)
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+
+def get_chat_session_ro(session_id: int, db: Session = Depends(get_db_ro)) -> ChatSession:
+    """get_chat_session on the read-only pool, for routes that only read the session"""
+    return get_chat_session(session_id, db)
+
+
+@router.get("/sessions", response_model=None, responses={200: {"model": ChatSessionListResponse}})
 def list_sessions(
     include_archived: bool = Query(False, description="Include archived sessions in the response"),
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_db_ro),
 ):
     """List chat sessions"""
-    query = db.query(ChatSession)
+    session_summaries = [
+        _serialize_session(session, message_count, _format_preview(assistant_preview))
+        for session, message_count, assistant_preview in chat_service.list_sessions(db, include_archived)
+    ]
 
-    if not include_archived:
-        query = query.filter(ChatSession.is_archived == False)
+    # Returning the model would make FastAPI dump it to a dict and validate that again;
+    # serialize the constructed summaries once in pydantic-core instead
+    payload = ChatSessionListResponse.model_construct(sessions=session_summaries)
+    return Response(content=payload.model_dump_json(), media_type="application/json")
 
-    sessions = query.order_by(ChatSession.updated_at.desc()).all()
 
-    session_summaries = []
-    for session in sessions:
-        # Count messages for each session
-        message_count = db.query(ChatMessage).filter(ChatMessage.session_id == session.id).count()
+def _prepare_chat_turn(
+    request: SendMessageRequest, db: Session
+) -> Tuple[Optional[ChatSession], Optional[str], Dict[str, Any], str]:
+    """
+    Validate a send-message body and resolve its session and table
 
-        # Get the latest assistant message for preview
-        assistant_preview = None
-        latest_assistant = (
-            db.query(ChatMessage.content)
-            .filter(ChatMessage.session_id == session.id, ChatMessage.role == "assistant")
-            .order_by(ChatMessage.created_at.desc())
-            .first()
+    Returns (session, new_session_title, ai_request, table_name). A new session is not
+    created here; session is None and new_session_title is set so the turn's single
+    commit can create it together with the messages.
+    """
+    query_text = request.query
+    file_id = request.file_id
+    session_id = request.session_id
+
+    if not query_text:
+        raise HTTPException(status_code=400, detail="Query cannot be empty")
+
+    if not file_id:
+        raise HTTPException(status_code=400, detail="file_id is required")
+
+    # Get existing chat session
+    session = None
+    if session_id:
+        try:
+            session = chat_service.get_session(db, session_id)
+        except ValueError:
+            session = None
+    new_session_title = None if session else (request.session_title or f"Query: {query_text[:50]}...")
+
+    ai_request = {
+        "query": query_text,
+        "file_id": file_id,
+        "context": request.context
+    }
+
+    # Shared with the /ai routes: table names never change once assigned, so warm lookups skip the database
+    try:
+        table_name = get_dynamic_table_name(db, file_id)
+    except HTTPException:
+        raise HTTPException(status_code=404, detail="File not found or not processed")
+
+    return session, new_session_title, ai_request, table_name
+
+
+def _record_chat_turn(
+    db: Session,
+    session: Optional[ChatSession],
+    new_session_title: Optional[str],
+    ai_request: Dict[str, Any],
+    ai_response: Dict[str, Any],
+) -> SendMessageResponse:
+    """Persist the (new) session, user message and AI response in one commit and build the send-message response"""
+    query_text = ai_request["query"]
+    created = session is None
+    if created:
+        session = chat_service.create_session(
+            db,
+            title=new_session_title,
+            file_id=ai_request["file_id"],
+            user_id=1,  # Default anonymous user
+            commit=False
         )
-        if latest_assistant:
-            assistant_preview = latest_assistant.content[:100] + "..." if len(latest_assistant.content) > 100 else latest_assistant.content
 
-        session_summaries.append(_serialize_session(session, message_count, assistant_preview))
+    user_message, assistant_message, _ = chat_service.add_exchange(
+        db,
+        session,
+        user_content=query_text,
+        assistant_content=ai_response.get("explanation", "Analysis complete"),
+        sql_query=ai_response.get("sql_query"),
+        payload={
+            "executed_results": ai_response.get("executed_results"),
+            "visualizations": ai_response.get("visualizations"),
+            "data_quality_disclaimer": ai_response.get("data_quality_disclaimer")
+        },
+        user_id=1  # Default anonymous user
+    )
 
-    return ChatSessionListResponse(sessions=session_summaries)
+    # Everything below comes from rows we just wrote, so build the models without validation
+    explanation = ai_response.get("explanation", "")
+    created_session = None if not created else ChatSessionSummary.model_construct(
+        id=session.id,
+        title=session.title,
+        summary=session.summary,
+        file_id=session.file_id,
+        is_archived=session.is_archived,
+        created_at=session.created_at,
+        updated_at=session.updated_at,
+        last_interaction_at=session.last_interaction_at,
+        message_count=2,  # user + assistant messages
+        assistant_preview=_format_preview(explanation)
+    )
+    messages = [
+        ChatMessageResponse.model_construct(
+            id=message.id,
+            session_id=session.id,
+            role=message.role,
+            content=message.content,
+            sql_query=message.sql_query,
+            payload=message.payload,
+            created_at=message.created_at
+        )
+        for message in (user_message, assistant_message)
+    ]
+
+    return SendMessageResponse.model_construct(
+        status="completed",
+        query=query_text,
+        sql_query=ai_response.get("sql_query"),
+        executed_results=ai_response.get("executed_results"),
+        visualizations=ai_response.get("visualizations"),
+        explanation=ai_response.get("explanation"),
+        data_quality_disclaimer=ai_response.get("data_quality_disclaimer"),
+        error=None,
+        session_id=session.id,
+        session_title=session.title,
+        created_session=created_session,
+        messages=messages
+    )
 
 
-@router.post("/send-message")
-async def send_message(
-    request: Dict[str, Any],
+def _sse_event(event: str, data: Any) -> bytes:
+    """Encode one Server-Sent Event with a JSON data line"""
+    payload = orjson.dumps(data, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY)
+    return b"event: " + event.encode() + b"\ndata: " + payload + b"\n\n"
+
+
+def _stream_chat_turn(
+    db: Session,
+    session: Optional[ChatSession],
+    new_session_title: Optional[str],
+    ai_request: Dict[str, Any],
+    table_name: str,
+) -> Iterator[bytes]:
+    """Relay pipeline stages as they finish, then persist the turn and send the full response as "done" """
+    try:
+        file_id = ai_request["file_id"]
+        cache_key = ai_response_cache_key(file_id, table_name, ai_request["query"], ai_request["context"])
+        ai_response = get_cached_ai_response(cache_key)
+        if ai_response is None:
+            # End the write transaction so the database lock is not held across the model call;
+            # the generated SQL runs on the read-only pool rather than taking a write connection
+            db.commit()
+
+            gemini_service = get_gemini_service()
+            for event, data in gemini_service.stream_ai_query(ai_request, table_name, read_engine):
+                if event in ("completed", "error"):
+                    ai_response = data
+                else:
+                    yield _sse_event(event, data)
+            cache_ai_response(cache_key, file_id, ai_response)
+
+        response = _record_chat_turn(db, session, new_session_title, ai_request, ai_response)
+        yield _sse_event("done", response.model_dump())
+    except Exception as e:
+        yield _sse_event("error", {"detail": f"Chat message failed: {str(e)}"})
+
+
+@router.post("/send-message", response_model=None, responses={200: {"model": SendMessageResponse}})
+def send_message(
+    request: SendMessageRequest,
     db: Session = Depends(get_db)
 ):
     """
     Send a message and get AI response
 
     Args:
-        request: Dictionary containing query, file_id, session_id, session_title
+        request: Message with query, file_id, optional context, session_id and session_title
         db: Database session
 
     Returns:
         AI response with messages for chat interface
     """
     try:
-        query_text = request.get("query", "")
-        file_id = request.get("file_id")
-        session_id = request.get("session_id")
-        session_title = request.get("session_title")
-
-        if not query_text:
-            raise HTTPException(status_code=400, detail="Query cannot be empty")
-
-        if not file_id:
-            raise HTTPException(status_code=400, detail="file_id is required")
-
-        # Get or create chat session
-        if session_id:
-            try:
-                session = chat_service.get_session(db, session_id)
-            except ValueError:
-                session = None
-
-        if not session_id or not session:
-            # Create new session
-            session = chat_service.create_session(
-                db,
-                title=session_title or f"Query: {query_text[:50]}...",
-                file_id=file_id,
-                user_id=1  # Default anonymous user
-            )
+        session, new_session_title, ai_request, table_name = _prepare_chat_turn(request, db)
+        file_id = ai_request["file_id"]
+
+        # Repeat questions about the same file are answered from the shared AI response cache
+        cache_key = ai_response_cache_key(file_id, table_name, ai_request["query"], ai_request["context"])
+        ai_response = get_cached_ai_response(cache_key)
+        if ai_response is None:
+            # End the write transaction so the database lock is not held across the model call;
+            # the generated SQL runs on the read-only pool rather than taking a write connection
+            db.commit()
 
-        # Add user message to database
-        user_message = chat_service.add_message(
-            db,
-            session,
-            role="user",
-            content=query_text,
-            user_id=1  # Default anonymous user
-        )
+            gemini_service = get_gemini_service()
+            ai_response = gemini_service.execute_ai_query(ai_request, table_name, read_engine)
+            cache_ai_response(cache_key, file_id, ai_response)
 
-        # Get AI response
-        ai_request = {
-            "query": query_text,
-            "file_id": file_id,
-            "context": request.get("context")
-        }
+        response = _record_chat_turn(db, session, new_session_title, ai_request, ai_response)
+        return ORJSONResponse(response.model_dump())
 
-        # Import here to avoid circular imports
-        from ..models.base import UploadedFile
-        file = db.query(UploadedFile).filter(UploadedFile.id == file_id).first()
-        if not file or not file.dynamic_table_name:
-            raise HTTPException(status_code=404, detail="File not found or not processed")
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Chat message failed: {str(e)}")
 
-        gemini_service = get_gemini_service()
-        ai_response = gemini_service.execute_ai_query(ai_request, file.dynamic_table_name, db.bind)
 
-        # Add AI response to database
-        assistant_message = chat_service.add_message(
-            db,
-            session,
-            role="assistant",
-            content=ai_response.get("explanation", "Analysis complete"),
-            sql_query=ai_response.get("sql_query"),
-            payload={
-                "executed_results": ai_response.get("executed_results"),
-                "visualizations": ai_response.get("visualizations"),
-                "data_quality_disclaimer": ai_response.get("data_quality_disclaimer")
-            },
-            user_id=1  # Default anonymous user
-        )
+@router.post("/send-message/stream", response_class=StreamingResponse)
+def send_message_stream(
+    request: SendMessageRequest,
+    db: Session = Depends(get_db)
+):
+    """
+    Send a message and stream the AI response as Server-Sent Events
 
-        # Return response in format expected by frontend
-        return {
-            "status": "completed",
-            "query": query_text,
-            "sql_query": ai_response.get("sql_query"),
-            "executed_results": ai_response.get("executed_results"),
-            "visualizations": ai_response.get("visualizations"),
-            "explanation": ai_response.get("explanation"),
-            "data_quality_disclaimer": ai_response.get("data_quality_disclaimer"),
-            "session_id": session.id,
-            "created_session": None if session_id else {
-                "id": session.id,
-                "title": session.title,
-                "summary": session.summary,
-                "file_id": session.file_id,
-                "is_archived": session.is_archived,
-                "created_at": session.created_at.isoformat(),
-                "updated_at": session.updated_at.isoformat(),
-                "last_interaction_at": session.last_interaction_at.isoformat() if session.last_interaction_at else None,
-                "message_count": 2,  # user + assistant messages
-                "assistant_preview": ai_response.get("explanation", "")[:100] + "..." if len(ai_response.get("explanation", "")) > 100 else ai_response.get("explanation", "")
-            },
-            "messages": [
-                {
-                    "id": user_message.id,
-                    "session_id": session.id,
-                    "user_id": None,
-                    "role": "user",
-                    "content": user_message.content,
-                    "sql_query": None,
-                    "payload": None,
-                    "created_at": user_message.created_at.isoformat()
-                },
-                {
-                    "id": assistant_message.id,
-                    "session_id": session.id,
-                    "user_id": None,
-                    "role": "assistant",
-                    "content": assistant_message.content,
-                    "sql_query": assistant_message.sql_query,
-                    "payload": assistant_message.payload,
-                    "created_at": assistant_message.created_at.isoformat()
-                }
-            ]
-        }
+    Emits "sql", "results" and "visualizations" events as each pipeline stage finishes,
+    then a "done" event carrying the same body as /chat/send-message once the turn is saved.
+
+    Args:
+        request: Message with query, file_id, optional context, session_id and session_title
+        db: Database session
 
+    Returns:
+        text/event-stream response
+    """
+    try:
+        session, new_session_title, ai_request, table_name = _prepare_chat_turn(request, db)
     except HTTPException:
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Chat message failed: {str(e)}")
 
+    return StreamingResponse(
+        _stream_chat_turn(db, session, new_session_title, ai_request, table_name),
+        media_type="text/event-stream",
+        # An explicit encoding keeps GZipMiddleware from buffering events inside the compressor
+        headers={"Cache-Control": "no-cache", "Content-Encoding": "identity"},
+    )
+
 
-@router.get("/sessions/{session_id}/messages")
-async def get_session_messages(
+@router.get("/sessions/{session_id}/messages", response_model=None, responses={200: {"model": ChatMessageListResponse}})
+def get_session_messages(
     session_id: int,
+    session: ChatSession = Depends(get_chat_session_ro),
     limit: int = Query(200, description="Maximum number of messages to return"),
     offset: int = Query(0, description="Number of messages to skip"),
-    db: Session = Depends(get_db)
+    before_id: Optional[int] = Query(None, description="Return the page of messages just older than this message"),
+    cursor: Optional[str] = Query(None, description="Opaque next_cursor from a previous page"),
+    after_id: Optional[int] = Query(None, description="Return the messages just newer than this message"),
+    db: Session = Depends(get_db_ro)
 ):
     """
     Get messages for a specific chat session
 
     Args:
         session_id: ID of the chat session
+        session: Chat session resolved from session_id
         limit: Maximum number of messages to return
-        offset: Number of messages to skip
+        offset: Number of messages to skip (ignored when before_id is given)
+        before_id: Message id to page backwards from
+        cursor: Keyset cursor to continue from, in the direction of the page that returned it
+            (takes precedence over before_id)
+        after_id: Message id to page forwards from (takes precedence over cursor and before_id)
         db: Database session
 
     Returns:
-        List of chat messages for the session
+        List of chat messages for the session, with next_cursor set on every full page; it pages
+        older from a before_id or backward cursor page, and newer from any other page
     """
+    before_created_at = after_created_at = None
+    if cursor is not None:
+        created_at, anchor_id, forward = _decode_message_cursor(cursor)
+        if not forward:
+            before_id, before_created_at = anchor_id, created_at
+        elif after_id is None:
+            after_id, after_created_at = anchor_id, created_at
+
     try:
-        session = chat_service.get_session(db, session_id)
-        messages = chat_service.list_messages(db, session_id, limit, offset)
-
-        return ChatMessageListResponse(
-            session_id=session_id,
-            messages=[
-                ChatMessageResponse(
-                    id=msg.id,
-                    session_id=msg.session_id,
-                    user_id=msg.user_id,
-                    role=msg.role,
-                    content=msg.content,
-                    sql_query=msg.sql_query,
-                    payload=msg.payload,
-                    created_at=msg.created_at.isoformat()
-                )
-                for msg in messages
-            ]
+        stmt = chat_service.messages_page_stmt(
+            session_id, limit, offset, before_id, before_created_at, after_id, after_created_at
+        )
+        paging_back = before_id is not None and after_id is None
+        return StreamingResponse(
+            _stream_message_page(db, session_id, stmt, limit, forward=not paging_back),
+            media_type="application/json",
         )
 
-    except ValueError as e:
-        raise HTTPException(status_code=404, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to get session messages: {str(e)}")
 
 
-@router.post("/sessions")
-async def create_session(
-    request: Dict[str, Any],
+@router.post("/sessions", response_model=None, responses={200: {"model": CreateSessionResponse}})
+def create_session(
+    request: ChatSessionCreate,
     db: Session = Depends(get_db)
 ):
     """
     Create a new chat session
 
     Args:
-        request: Dictionary containing title and file_id
+        request: Optional title and file_id for the session
         db: Database session
 
     Returns:
         Created chat session
     """
-    try:
-        title = request.get("title")
-        file_id = request.get("file_id")
+    # Foreign keys are enforced, so an unknown file would otherwise surface as an IntegrityError
+    if request.file_id is not None and db.scalar(select(UploadedFile.id).where(UploadedFile.id == request.file_id)) is None:
+        raise HTTPException(status_code=404, detail="File not found")
 
-        session = chat_service.create_session(db, title=title, file_id=file_id, user_id=1)
+    try:
+        # Build the response from the flushed row, then commit; reading it after commit would reload it
+        session = chat_service.create_session(db, title=request.title, file_id=request.file_id, user_id=1, commit=False)
 
-        return ChatSessionResponse(
-            session=ChatSessionSummary(
+        response = CreateSessionResponse.model_construct(
+            session=ChatSessionSummary.model_construct(
                 id=session.id,
                 title=session.title,
                 summary=session.summary,
                 file_id=session.file_id,
                 is_archived=session.is_archived,
-                created_at=session.created_at.isoformat(),
-                updated_at=session.updated_at.isoformat(),
-                last_interaction_at=session.last_interaction_at.isoformat() if session.last_interaction_at else None,
+                created_at=session.created_at,
+                updated_at=session.updated_at,
+                last_interaction_at=session.last_interaction_at,
                 message_count=0,
                 assistant_preview=None
             )
         )
+        db.commit()
+        return ORJSONResponse(response.model_dump())
 
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to create session: {str(e)}")
 
 
 @router.put("/sessions/{session_id}")
-async def update_session(
+def update_session(
     session_id: int,
     request: Dict[str, Any],
+    session: ChatSession = Depends(get_chat_session),
     db: Session = Depends(get_db)
 ):
     """
@@ -305,14 +442,13 @@ async def update_session(
     Args:
         session_id: ID of the chat session
         request: Dictionary containing update fields (title, is_archived, etc.)
+        session: Chat session resolved from session_id
         db: Database session
 
     Returns:
         Updated chat session
     """
     try:
-        session = chat_service.get_session(db, session_id)
-
         title = request.get("title")
         is_archived = request.get("is_archived")
 
@@ -320,33 +456,28 @@ async def update_session(
             db,
             session,
             title=title,
-            is_archived=is_archived
+            is_archived=is_archived,
+            commit=False
         )
 
-        return ChatSessionResponse(
-            session=ChatSessionSummary(
-                id=updated_session.id,
-                title=updated_session.title,
-                summary=updated_session.summary,
-                file_id=updated_session.file_id,
-                is_archived=updated_session.is_archived,
-                created_at=updated_session.created_at.isoformat(),
-                updated_at=updated_session.updated_at.isoformat(),
-                last_interaction_at=updated_session.last_interaction_at.isoformat() if updated_session.last_interaction_at else None,
-                message_count=0,  # Will be calculated separately
-                assistant_preview=None
+        response = ChatSessionResponse.model_construct(
+            session=_serialize_session(
+                updated_session,
+                updated_session.message_count or 0,
+                _format_preview(updated_session.assistant_preview),
             )
         )
+        db.commit()
+        return response
 
-    except ValueError as e:
-        raise HTTPException(status_code=404, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to update session: {str(e)}")
 
 
 @router.delete("/sessions/{session_id}")
-async def delete_session(
+def delete_session(
     session_id: int,
+    session: ChatSession = Depends(get_chat_session),
     db: Session = Depends(get_db)
 ):
     """
@@ -354,25 +485,23 @@ async def delete_session(
 
     Args:
         session_id: ID of the chat session
+        session: Chat session resolved from session_id
         db: Database session
 
     Returns:
         Deletion confirmation
     """
     try:
-        session = chat_service.get_session(db, session_id)
         chat_service.delete_session(db, session)
 
         return {"message": "Session deleted successfully", "session_id": session_id}
 
-    except ValueError as e:
-        raise HTTPException(status_code=404, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to delete session: {str(e)}")
 
 
 @router.put("/messages/{message_id}")
-async def update_message(
+def update_message(
     message_id: int,
     request: Dict[str, Any],
     db: Session = Depends(get_db)
@@ -389,7 +518,13 @@ async def update_message(
         Updated chat message
     """
     try:
-        message = db.query(ChatMessage).filter(ChatMessage.id == message_id).first()
+        # Assistant edits refresh the owning session's stats, so load it up front; any other lazy load is a bug
+        message = (
+            db.query(ChatMessage)
+            .options(joinedload(ChatMessage.session), raiseload("*"))
+            .filter(ChatMessage.id == message_id)
+            .first()
+        )
         if not message:
             raise HTTPException(status_code=404, detail="Message not found")
 
@@ -397,20 +532,22 @@ async def update_message(
         if content is not None:
             message.content = content
             message.updated_at = datetime.utcnow()
+            if message.role == "assistant":
+                chat_service.refresh_session_metrics(db, message.session)
 
-        db.commit()
-        db.refresh(message)
-
-        return ChatMessageResponse(
+        # Build the response from the loaded row; after commit every attribute would be reloaded
+        response = ChatMessageResponse.model_construct(
             id=message.id,
             session_id=message.session_id,
-            user_id=message.user_id,
             role=message.role,
             content=message.content,
             sql_query=message.sql_query,
             payload=message.payload,
-            created_at=message.created_at.isoformat()
+            created_at=message.created_at
         )
+        db.commit()
+
+        return response
 
     except HTTPException:
         raise
@@ -419,7 +556,7 @@ async def update_message(
 
 
 @router.delete("/messages/{message_id}")
-async def delete_message(
+def delete_message(
     message_id: int,
     db: Session = Depends(get_db)
 ):
@@ -434,19 +571,23 @@ async def delete_message(
         Deletion confirmation
     """
     try:
-        message = db.query(ChatMessage).filter(ChatMessage.id == message_id).first()
+        # The owning session is needed below, so fetch it in the same query
+        message = (
+            db.query(ChatMessage)
+            .options(joinedload(ChatMessage.session), raiseload("*"))
+            .filter(ChatMessage.id == message_id)
+            .first()
+        )
         if not message:
             raise HTTPException(status_code=404, detail="Message not found")
 
-        # Update session's last_interaction_at if this was the last message
+        # Touch the session timestamp and stats in the same transaction as the delete
         session = message.session
         db.delete(message)
-        db.commit()
-
-        # Update session timestamp if needed
         if session:
             session.updated_at = datetime.utcnow()
-            db.commit()
+            chat_service.refresh_session_metrics(db, session)
+        db.commit()
 
         return {"message": "Message deleted successfully", "message_id": message_id}
 
@@ -457,17 +598,19 @@ async def delete_message(
 
 
 @router.get("/sessions/{session_id}/search")
-async def search_session_messages(
+def search_session_messages(
     session_id: int,
+    session: ChatSession = Depends(get_chat_session_ro),
     query: str = Query(..., description="Search query"),
     limit: int = Query(50, description="Maximum number of results"),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_db_ro)
 ):
     """
     Search messages within a chat session
 
     Args:
         session_id: ID of the chat session
+        session: Chat session resolved from session_id
         query: Search query string
         limit: Maximum number of results to return
         db: Database session
@@ -476,21 +619,11 @@ async def search_session_messages(
         List of matching messages with context
     """
     try:
-        # Verify session exists
-        session = chat_service.get_session(db, session_id)
-
         # Search in messages (case-insensitive)
-        search_results = db.query(ChatMessage).filter(
-            and_(
-                ChatMessage.session_id == session_id,
-                or_(
-                    ChatMessage.content.ilike(f"%{query}%"),
-                    ChatMessage.sql_query.ilike(f"%{query}%")
-                )
-            )
-        ).order_by(ChatMessage.created_at.desc()).limit(limit).all()
+        search_results = chat_service.search_messages(db, session_id, query, limit)
+        pattern = re.compile(re.escape(query), re.IGNORECASE)
 
-        return {
+        return ORJSONResponse({
             "session_id": session_id,
             "query": query,
             "results": [
@@ -499,31 +632,31 @@ async def search_session_messages(
                     "role": msg.role,
                     "content": msg.content,
                     "sql_query": msg.sql_query,
-                    "created_at": msg.created_at.isoformat(),
-                    "match_context": _get_message_context(msg, query)
+                    "created_at": msg.created_at,
+                    "match_context": _get_message_context(msg, pattern)
                 }
                 for msg in search_results
             ],
             "total_results": len(search_results)
-        }
+        })
 
-    except ValueError as e:
-        raise HTTPException(status_code=404, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Search failed: {str(e)}")
 
 
 @router.get("/sessions/{session_id}/export")
-async def export_session(
+def export_session(
     session_id: int,
+    session: ChatSession = Depends(get_chat_session_ro),
     format: str = Query("json", description="Export format (json, txt)"),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_db_ro)
 ):
     """
     Export a chat session
 
     Args:
         session_id: ID of the chat session
+        session: Chat session resolved from session_id
         format: Export format (json, txt)
         db: Database session
 
@@ -531,61 +664,29 @@ async def export_session(
         Exported session data
     """
     try:
-        session = chat_service.get_session(db, session_id)
-        messages = chat_service.list_messages(db, session_id, limit=1000)
+        if format not in ("json", "txt"):
+            raise HTTPException(status_code=400, detail="Unsupported export format")
+
+        # Read the stored counter; older rows fall back to a count that stops at the export limit
+        message_count = session.message_count
+        if message_count is None:
+            capped = select(ChatMessage.id).where(ChatMessage.session_id == session_id).limit(EXPORT_MESSAGE_LIMIT)
+            message_count = db.scalar(select(func.count()).select_from(capped.subquery()))
+        message_count = min(message_count, EXPORT_MESSAGE_LIMIT)
 
         if format == "json":
-            export_data = {
-                "session": {
-                    "id": session.id,
-                    "title": session.title,
-                    "created_at": session.created_at.isoformat(),
-                    "message_count": len(messages)
-                },
-                "messages": [
-                    {
-                        "id": msg.id,
-                        "role": msg.role,
-                        "content": msg.content,
-                        "sql_query": msg.sql_query,
-                        "created_at": msg.created_at.isoformat()
-                    }
-                    for msg in messages
-                ]
-            }
-            return export_data
-
-        elif format == "txt":
-            lines = [
-                f"Chat Session: {session.title}",
-                f"Created: {session.created_at.isoformat()}",
-                f"Messages: {len(messages)}",
-                "",
-                "=" * 50,
-                ""
-            ]
-
-            for msg in messages:
-                timestamp = msg.created_at.strftime("%Y-%m-%d %H:%M:%S")
-                lines.append(f"[{timestamp}] {msg.role.upper()}:")
-                lines.append(msg.content)
-                if msg.sql_query:
-                    lines.append(f"SQL: {msg.sql_query}")
-                lines.append("")
-
-            return {"content": "\n".join(lines), "filename": f"chat_session_{session_id}.txt"}
-
-        else:
-            raise HTTPException(status_code=400, detail="Unsupported export format")
+            return StreamingResponse(_stream_session_json(db, session, message_count), media_type="application/json")
 
-    except ValueError as e:
-        raise HTTPException(status_code=404, detail=str(e))
+        return StreamingResponse(_stream_session_txt(db, session, message_count), media_type="application/json")
+
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Export failed: {str(e)}")
 
 
 @router.post("/messages/{message_id}/feedback")
-async def add_message_feedback(
+def add_message_feedback(
     message_id: int,
     request: Dict[str, Any],
     db: Session = Depends(get_db)
@@ -602,18 +703,9 @@ async def add_message_feedback(
         Updated message with feedback
     """
     try:
-        message = db.query(ChatMessage).filter(ChatMessage.id == message_id).first()
-        if not message:
-            raise HTTPException(status_code=404, detail="Message not found")
-
         feedback_type = request.get("feedback_type")  # thumbs_up, thumbs_down, helpful, not_helpful
         feedback_text = request.get("feedback_text")
 
-        # Store feedback in message payload
-        payload = message.payload or {}
-        if "feedback" not in payload:
-            payload["feedback"] = []
-
         feedback_entry = {
             "type": feedback_type,
             "text": feedback_text,
@@ -621,17 +713,15 @@ async def add_message_feedback(
             "user_id": 1  # Anonymous user
         }
 
-        payload["feedback"].append(feedback_entry)
-        message.payload = payload
-        message.updated_at = datetime.utcnow()
-
-        db.commit()
-        db.refresh(message)
+        # Appended in SQL so the stored payload (query results included) never round-trips through Python
+        feedback_count = chat_service.add_feedback(db, message_id, feedback_entry)
+        if feedback_count is None:
+            raise HTTPException(status_code=404, detail="Message not found")
 
         return {
             "message": "Feedback added successfully",
             "message_id": message_id,
-            "feedback_count": len(payload["feedback"])
+            "feedback_count": feedback_count
         }
 
     except HTTPException:
@@ -640,20 +730,111 @@ async def add_message_feedback(
         raise HTTPException(status_code=500, detail=f"Failed to add feedback: {str(e)}")
 
 
+def _export_messages_stmt(session_id: int):
+    """Select the exported message columns, oldest first, capped at EXPORT_MESSAGE_LIMIT"""
+    return (
+        select(ChatMessage.id, ChatMessage.role, ChatMessage.content, ChatMessage.sql_query, ChatMessage.created_at)
+        .where(ChatMessage.session_id == session_id)
+        .order_by(ChatMessage.created_at.asc())
+        .limit(EXPORT_MESSAGE_LIMIT)
+    )
+
+
+def _stream_session_json(db: Session, session: ChatSession, message_count: int) -> Iterator[bytes]:
+    """Yield a session export as JSON, fetching messages in batches instead of materializing them"""
+    header = {
+        "id": session.id,
+        "title": session.title,
+        "created_at": session.created_at,
+        "message_count": message_count,
+    }
+    yield b'{"session":' + orjson.dumps(header) + b',"messages":['
+
+    rows = db.execute(_export_messages_stmt(session.id).execution_options(yield_per=200))
+    separator = b""
+    for row in rows:
+        # orjson writes created_at in the same ISO format isoformat() produced
+        yield separator + orjson.dumps(row._asdict())
+        separator = b","
+    yield b"]}"
+
+
+def _stream_session_txt(db: Session, session: ChatSession, message_count: int) -> Iterator[bytes]:
+    """
+    Yield a plain-text transcript wrapped as {"content": ..., "filename": ...}
+
+    The transcript is written into the JSON string piece by piece, escaping each message as it
+    is fetched, so the whole text is never joined in memory.
+    """
+    header = [
+        f"Chat Session: {session.title}",
+        f"Created: {session.created_at.isoformat()}",
+        f"Messages: {message_count}",
+        "",
+        "=" * 50,
+        "",
+    ]
+    # orjson.dumps of a str is a quoted, escaped JSON string; the slice drops the quotes
+    yield b'{"content":"' + orjson.dumps("\n".join(header))[1:-1]
+
+    # Plain column tuples; the ORM path would also decode every message's JSON payload
+    rows = db.execute(_export_messages_stmt(session.id).execution_options(yield_per=200))
+    for msg in rows:
+        lines = [f"[{msg.created_at.strftime('%Y-%m-%d %H:%M:%S')}] {msg.role.upper()}:", msg.content]
+        if msg.sql_query:
+            lines.append(f"SQL: {msg.sql_query}")
+        lines.append("")
+        yield orjson.dumps("".join("\n" + line for line in lines))[1:-1]
+
+    yield b'","filename":' + orjson.dumps(f"chat_session_{session.id}.txt") + b"}"
+
+
+def _stream_message_page(db: Session, session_id: int, stmt, cursor_limit: int, forward: bool = False) -> Iterator[bytes]:
+    """
+    Yield a ChatMessageListResponse body, encoding messages in batches as they are fetched
+
+    When the page holds cursor_limit messages, next_cursor continues from the page's oldest
+    message, or from its newest message when paging forward.
+    """
+    yield b'{"session_id":' + orjson.dumps(session_id) + b',"messages":['
+
+    separator = b""
+    oldest = newest = None
+    count = 0
+    # Rows come straight from the database, so skip per-message Pydantic validation
+    for msg in db.scalars(stmt, execution_options={"yield_per": 50}):
+        if oldest is None:
+            oldest = msg
+        newest = msg
+        count += 1
+        yield separator + orjson.dumps({
+            "id": msg.id,
+            "session_id": msg.session_id,
+            "role": msg.role,
+            "content": msg.content,
+            "sql_query": msg.sql_query,
+            "payload": msg.payload,
+            "created_at": msg.created_at,
+        }, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY)
+        separator = b","
+
+    next_cursor = None
+    if count == cursor_limit:
+        next_cursor = _encode_message_cursor(newest, forward=True) if forward else _encode_message_cursor(oldest)
+    yield b'],"next_cursor":' + orjson.dumps(next_cursor) + b"}"
+
+
 # Helper function for search context
-def _get_message_context(message: ChatMessage, query: str) -> str:
+def _get_message_context(message: ChatMessage, pattern: "re.Pattern[str]") -> str:
     """Get context around the search match in a message"""
-    content = message.content.lower()
-    query_lower = query.lower()
-
-    # Find the position of the query in the content
-    start_pos = content.find(query_lower)
-    if start_pos == -1:
+    # Match case-insensitively on the original text; lower() would copy every message and can shift offsets
+    match = pattern.search(message.content)
+    if not match:
         return ""
 
     # Get context around the match (50 characters before and after)
-    context_start = max(0, start_pos - 50)
-    context_end = min(len(message.content), start_pos + len(query) + 50)
+    context_start = max(0, match.start() - 50)
+    context_end = min(len(message.content), match.end() + 50)
 
     context = message.content[context_start:context_end]
 
@@ -1,10 +1,18 @@
 from datetime import datetime
 from typing import Any, Dict, List, Optional, Tuple
 
-from sqlalchemy import func
-from sqlalchemy.orm import Session
+import orjson
+from sqlalchemy import String, Select, case, delete, func, insert, literal, or_, select, tuple_, type_coerce, update
+from sqlalchemy.orm import Session, aliased, raiseload
 
-from ..models.base import ChatMessage, ChatSession
+from ..models.base import ChatMessage, ChatSession, QueryHistory, chat_messages_fts
+
+
+# Up to this many sessions, metrics come from one scan of their messages instead of two aggregates
+INLINE_METRICS_SESSION_LIMIT = 20
+
+# Preview text is cut in SQL; one character past the 100 shown tells callers whether to add an ellipsis
+PREVIEW_FETCH_LENGTH = 101
 
 
 class ChatService:
@@ -15,22 +23,91 @@ class ChatService:
         db: Session,
         include_archived: bool = False,
     ) -> List[Tuple[ChatSession, int, Optional[str]]]:
-        """Return chat sessions sorted by last interaction."""
-        query = (
-            db.query(
-                ChatSession,
-                func.count(ChatMessage.id).label("message_count"),
-                func.max(ChatMessage.content).filter(ChatMessage.role == "assistant").label("assistant_preview"),
-            )
-            .outerjoin(ChatMessage, ChatMessage.session_id == ChatSession.id)
-            .group_by(ChatSession.id)
-        )
+        """
+        Return chat sessions, most recently updated first, with their message count and preview.
 
+        Counts and previews come from the columns kept up to date on each session; only rows
+        that predate them are aggregated from their messages.
+        """
+        query = db.query(ChatSession)
         if not include_archived:
             query = query.filter(ChatSession.is_archived.is_(False))
+        sessions = query.order_by(ChatSession.updated_at.desc()).all()
+
+        missing_ids = [session.id for session in sessions if session.message_count is None]
+        counts, previews = self.session_metrics(db, missing_ids)
+
+        return [
+            (session, counts.get(session.id, 0), previews.get(session.id))
+            if session.message_count is None
+            else (session, session.message_count, session.assistant_preview)
+            for session in sessions
+        ]
+
+    def session_metrics(
+        self,
+        db: Session,
+        session_ids: List[int],
+    ) -> Tuple[Dict[int, int], Dict[int, str]]:
+        """Return message counts and a prefix of the latest assistant content per session, in two set-based queries."""
+        if not session_ids:
+            return {}, {}
+        if len(session_ids) <= INLINE_METRICS_SESSION_LIMIT:
+            return self._session_metrics_inline(db, session_ids)
+
+        counts = dict(
+            db.query(ChatMessage.session_id, func.count(ChatMessage.id))
+            .filter(ChatMessage.session_id.in_(session_ids))
+            .group_by(ChatMessage.session_id)
+            .all()
+        )
+
+        ranked = (
+            select(
+                ChatMessage.session_id,
+                func.substr(ChatMessage.content, 1, PREVIEW_FETCH_LENGTH).label("content"),
+                func.row_number()
+                # created_at has one-second resolution, so the id breaks ties between same-second replies
+                .over(partition_by=ChatMessage.session_id, order_by=(ChatMessage.created_at.desc(), ChatMessage.id.desc()))
+                .label("rn"),
+            )
+            .where(ChatMessage.session_id.in_(session_ids), ChatMessage.role == "assistant")
+            .subquery()
+        )
+        previews = dict(db.execute(select(ranked.c.session_id, ranked.c.content).where(ranked.c.rn == 1)).all())
+        return counts, previews
 
-        query = query.order_by(func.coalesce(ChatSession.last_interaction_at, ChatSession.created_at).desc())
-        return query.all()
+    def _session_metrics_inline(
+        self,
+        db: Session,
+        session_ids: List[int],
+    ) -> Tuple[Dict[int, int], Dict[int, str]]:
+        """Compute session metrics in Python from a single index-ordered scan of their messages."""
+        rows = db.execute(
+            select(
+                ChatMessage.session_id,
+                # Only assistant content is needed, so user messages come back as NULL
+                case((ChatMessage.role == "assistant", func.substr(ChatMessage.content, 1, PREVIEW_FETCH_LENGTH))),
+                ChatMessage.role == "assistant",
+            )
+            .where(ChatMessage.session_id.in_(session_ids))
+            .order_by(ChatMessage.session_id, ChatMessage.created_at, ChatMessage.id)
+        )
+        counts: Dict[int, int] = {}
+        previews: Dict[int, str] = {}
+        for session_id, content, is_assistant in rows:
+            counts[session_id] = counts.get(session_id, 0) + 1
+            if is_assistant:
+                # Rows are oldest first, so the last assistant row wins
+                previews[session_id] = content
+        return counts, previews
+
+    def refresh_session_metrics(self, db: Session, session: ChatSession) -> None:
+        """Recompute a session's denormalized count and preview after messages were edited or removed."""
+        db.flush()
+        counts, previews = self.session_metrics(db, [session.id])
+        session.message_count = counts.get(session.id, 0)
+        session.assistant_preview = previews.get(session.id)
 
     def create_session(
         self,
@@ -38,8 +115,14 @@ class ChatService:
         title: Optional[str] = None,
         file_id: Optional[int] = None,
         user_id: int = 1,
+        commit: bool = True,
     ) -> ChatSession:
-        """Create a new chat session."""
+        """
+        Create a new chat session.
+
+        With ``commit=False`` the row is only flushed, so the caller's next commit
+        writes it together with whatever else belongs to the same transaction.
+        """
         now = datetime.utcnow()
         session = ChatSession(
             user_id=user_id,
@@ -48,14 +131,23 @@ class ChatService:
             last_interaction_at=now,
         )
         db.add(session)
+        if not commit:
+            db.flush()
+            return session
         db.commit()
         db.refresh(session)
         return session
 
     def get_session(self, db: Session, session_id: int) -> ChatSession:
-        """Return a chat session."""
+        """
+        Return a chat session.
+
+        Relationships are set to raise instead of lazy loading; messages are paged with
+        ``list_messages`` rather than pulled in as a whole collection.
+        """
         session = (
             db.query(ChatSession)
+            .options(raiseload("*"))
             .filter(ChatSession.id == session_id)
             .first()
         )
@@ -72,8 +164,14 @@ class ChatService:
         summary: Optional[str] = None,
         is_archived: Optional[bool] = None,
         file_id: Optional[int] = None,
+        commit: bool = True,
     ) -> ChatSession:
-        """Update a chat session's metadata."""
+        """
+        Update a chat session's metadata.
+
+        With ``commit=False`` the changes are only flushed, so the caller can read the
+        updated row before committing instead of reloading it afterwards.
+        """
         updated = False
         if title is not None:
             session.title = title.strip() or session.title
@@ -89,14 +187,19 @@ class ChatService:
             updated = True
         if updated:
             session.updated_at = datetime.utcnow()
-        db.add(session)
+        if not commit:
+            db.flush()
+            return session
         db.commit()
         db.refresh(session)
         return session
 
     def delete_session(self, db: Session, session: ChatSession) -> None:
         """Delete a chat session and its messages."""
-        db.delete(session)
+        # Set-based statements instead of the ORM cascade, which would load every message first
+        db.execute(delete(ChatMessage).where(ChatMessage.session_id == session.id))
+        db.execute(update(QueryHistory).where(QueryHistory.session_id == session.id).values(session_id=None))
+        db.execute(delete(ChatSession).where(ChatSession.id == session.id))
         db.commit()
 
     def list_messages(
@@ -105,16 +208,105 @@ class ChatService:
         session_id: int,
         limit: int = 200,
         offset: int = 0,
+        before_id: Optional[int] = None,
+        before_created_at: Optional[datetime] = None,
+        after_id: Optional[int] = None,
+        after_created_at: Optional[datetime] = None,
     ) -> List[ChatMessage]:
-        """Fetch messages for a session ordered chronologically."""
-        return (
-            db.query(ChatMessage)
-            .filter(ChatMessage.session_id == session_id)
-            .order_by(ChatMessage.created_at.asc())
-            .offset(offset)
+        """Fetch messages for a session ordered chronologically (see ``messages_page_stmt``)."""
+        stmt = self.messages_page_stmt(
+            session_id, limit, offset, before_id, before_created_at, after_id, after_created_at
+        )
+        return db.scalars(stmt).all()
+
+    def messages_page_stmt(
+        self,
+        session_id: int,
+        limit: int = 200,
+        offset: int = 0,
+        before_id: Optional[int] = None,
+        before_created_at: Optional[datetime] = None,
+        after_id: Optional[int] = None,
+        after_created_at: Optional[datetime] = None,
+    ) -> Select:
+        """
+        Build the SELECT for one page of a session's messages, oldest first.
+
+        With ``before_id`` the page is the ``limit`` messages just older than that message,
+        found by a keyset seek on (created_at, id) instead of scanning past ``offset`` rows.
+        Passing ``before_created_at`` as well (as decoded from a cursor) skips looking up the anchor row.
+        With ``after_id`` the page is the ``limit`` messages just newer than that message, for
+        picking up replies that arrived since the client last loaded the session;
+        ``after_created_at`` skips the anchor lookup the same way.
+        """
+        if after_id is not None:
+            if after_created_at is None:
+                anchor = (
+                    select(ChatMessage.created_at)
+                    .where(ChatMessage.id == after_id, ChatMessage.session_id == session_id)
+                    .scalar_subquery()
+                )
+            else:
+                anchor = func.datetime(after_created_at)
+            return (
+                select(ChatMessage)
+                .where(
+                    ChatMessage.session_id == session_id,
+                    tuple_(ChatMessage.created_at, ChatMessage.id) > tuple_(anchor, after_id),
+                )
+                .order_by(ChatMessage.created_at.asc(), ChatMessage.id.asc())
+                .limit(limit)
+            )
+
+        if before_id is None:
+            return (
+                select(ChatMessage)
+                .where(ChatMessage.session_id == session_id)
+                .order_by(ChatMessage.created_at.asc(), ChatMessage.id.asc())
+                .offset(offset)
+                .limit(limit)
+            )
+
+        if before_created_at is None:
+            anchor = (
+                select(ChatMessage.created_at)
+                .where(ChatMessage.id == before_id, ChatMessage.session_id == session_id)
+                .scalar_subquery()
+            )
+        else:
+            # created_at is written by CURRENT_TIMESTAMP, so normalise the bound value to that text format
+            anchor = func.datetime(before_created_at)
+        # SQLite indexes carry the rowid, so (session_id, created_at) already orders ties by id
+        newest_first = (
+            select(ChatMessage)
+            .where(
+                ChatMessage.session_id == session_id,
+                tuple_(ChatMessage.created_at, ChatMessage.id) < tuple_(anchor, before_id),
+            )
+            .order_by(ChatMessage.created_at.desc(), ChatMessage.id.desc())
             .limit(limit)
-            .all()
+            .subquery()
         )
+        page = aliased(ChatMessage, newest_first)
+        return select(page).order_by(page.created_at.asc(), page.id.asc())
+
+    def search_messages(self, db: Session, session_id: int, query: str, limit: int = 50) -> List[ChatMessage]:
+        """
+        Return a session's messages whose content or SQL contains ``query``, newest first.
+
+        Queries of three or more characters go through the trigram FTS index; shorter ones
+        (or non-SQLite databases) fall back to a case-insensitive LIKE scan.
+        """
+        stmt = select(ChatMessage).where(ChatMessage.session_id == session_id)
+        if len(query) >= 3 and db.get_bind().dialect.name == "sqlite":
+            phrase = '"' + query.replace('"', '""') + '"'
+            matches = select(chat_messages_fts.c.rowid).where(chat_messages_fts.c.chat_messages_fts.op("MATCH")(phrase))
+            stmt = stmt.where(ChatMessage.id.in_(matches))
+        else:
+            stmt = stmt.where(
+                or_(ChatMessage.content.ilike(f"%{query}%"), ChatMessage.sql_query.ilike(f"%{query}%"))
+            )
+        return db.scalars(stmt.order_by(ChatMessage.created_at.desc()).limit(limit)).all()
 
     def add_message(
         self,
@@ -141,6 +333,10 @@ class ChatService:
         session.updated_at = now
         if role == "user" and not session.summary:
             session.summary = content[:140]
+        if role == "assistant":
+            session.assistant_preview = content[:PREVIEW_FETCH_LENGTH]
+        # Incremented in SQL so concurrent writers cannot lose an update
+        session.message_count = ChatSession.message_count + 1
         if session.is_archived:
             session.is_archived = False
         db.add(message)
@@ -149,5 +345,84 @@ class ChatService:
         db.refresh(message)
         return message
 
+    def add_exchange(
+        self,
+        db: Session,
+        session: ChatSession,
+        *,
+        user_content: str,
+        assistant_content: str,
+        sql_query: Optional[str] = None,
+        payload: Optional[Dict[str, Any]] = None,
+        user_id: Optional[int] = None,
+        history: Optional[Dict[str, Any]] = None,
+    ) -> Tuple[ChatMessage, ChatMessage, Optional[int]]:
+        """
+        Persist a user/assistant message pair, plus an optional QueryHistory row, in one transaction.
+
+        The history row is inserted first so its id can be recorded as ``query_id`` in the
+        assistant payload; both messages then go out as a single multi-row INSERT ... RETURNING.
+        """
+        history_id = None
+        if history is not None:
+            history_id = db.execute(
+                insert(QueryHistory).values(session_id=session.id, **history).returning(QueryHistory.id)
+            ).scalar_one()
+            payload = {**(payload or {}), "query_id": history_id}
+
+        user_message, assistant_message = db.scalars(
+            insert(ChatMessage).returning(ChatMessage, sort_by_parameter_order=True),
+            [
+                {
+                    "session_id": session.id,
+                    "user_id": user_id,
+                    "role": "user",
+                    "content": user_content,
+                },
+                {
+                    "session_id": session.id,
+                    "user_id": user_id,
+                    "role": "assistant",
+                    "content": assistant_content,
+                    "sql_query": sql_query,
+                    "payload": payload,
+                },
+            ],
+        ).all()
+
+        now = datetime.utcnow()
+        session.last_interaction_at = now
+        session.updated_at = now
+        if not session.summary:
+            session.summary = user_content[:140]
+        session.assistant_preview = assistant_content[:PREVIEW_FETCH_LENGTH]
+        session.message_count = ChatSession.message_count + 2
+        if session.is_archived:
+            session.is_archived = False
+        db.add(session)
+        db.commit()
+        return user_message, assistant_message, history_id
+
+    def add_feedback(self, db: Session, message_id: int, entry: Dict[str, Any]) -> Optional[int]:
+        """
+        Append a feedback entry to a message's payload and return the new feedback count.
+
+        The append happens inside SQLite with json_insert, so the (possibly large) payload
+        is never read into Python and concurrent feedback cannot overwrite each other.
+        Returns None when the message does not exist.
+        """
+        # JSON NULL is stored as the text 'null'; treat it like a missing payload
+        payload = func.coalesce(func.nullif(type_coerce(ChatMessage.payload, String), "null"), "{}")
+        with_list = func.json_insert(payload, "$.feedback", func.json(literal("[]")))
+        feedback_count = db.execute(
+            update(ChatMessage)
+            .where(ChatMessage.id == message_id)
+            .values(payload=func.json_insert(with_list, "$.feedback[#]", func.json(orjson.dumps(entry).decode())))
+            .returning(func.json_array_length(type_coerce(ChatMessage.payload, String), "$.feedback"))
+            .execution_options(synchronize_session=False)
+        ).scalar_one_or_none()
+        db.commit()
+        return feedback_count
+
 
 chat_service = ChatService()
@@ -3,9 +3,12 @@ Data cleaning service for handling dirty, inconsistent, or incomplete Excel data
 """
 
 import pandas as pd
-from typing import Tuple, List, Dict, Any
+from typing import Tuple, List, Dict, Any, Optional
 from datetime import datetime
 
+# Column dtypes whose missing values are filled with the median
+MEDIAN_FILL_DTYPES = ("int64", "float64", "Int64", "Float64")
+
 
 class DataCleaner:
     """Service for cleaning and preprocessing DataFrames from Excel files"""
@@ -16,6 +19,8 @@ class DataCleaner:
         self.issue_summary: Dict[str, int] = {}
         self.metrics: Dict[str, int] = {}
         self.columns_renamed: Dict[str, str] = {}
+        # Datetime parses of object columns that stayed text, kept with the original values for _standardize_dates
+        self._datetime_parses: Dict[str, Tuple[pd.Series, pd.Series]] = {}
 
     def clean(self, df: pd.DataFrame) -> Tuple[pd.DataFrame, Dict[str, Any]]:
         """
@@ -27,7 +32,8 @@ class DataCleaner:
         Returns:
             Tuple of cleaned DataFrame and metadata about cleaning operations
         """
-        working_df = df.copy()
+        # Every step replaces whole columns or returns a new frame, so sharing the caller's data is safe
+        working_df = df.copy(deep=False)
         self._reset_state(working_df)
 
         # Step 1: Handle unnamed columns
@@ -90,6 +96,7 @@ class DataCleaner:
             "text_standardized": 0,
         }
         self.columns_renamed = {}
+        self._datetime_parses = {}
         self.original_shape = (len(df), df.shape[1])
 
     def _record_issue(self, issue_type: str, message: str) -> None:
@@ -117,73 +124,114 @@ class DataCleaner:
 
     def _standardize_data_types(self, df: pd.DataFrame) -> pd.DataFrame:
         """Convert columns to appropriate data types, handling mixed types"""
-        for col in df.columns:
-            if df[col].dtype == "object":
-                # Try to convert to numeric if possible
-                numeric_series = pd.to_numeric(df[col], errors="coerce")
-                if len(df[col]) > 0 and (numeric_series.notna().sum() / len(df[col])) > 0.8:
-                    df[col] = numeric_series
-                    self._record_step(f"Converted column '{col}' to numeric")
-                    self._increment_metric("numeric_conversions", int(numeric_series.notna().sum()))
-                    continue
-
-                datetime_series = pd.to_datetime(df[col], errors="coerce")
-                if len(df[col]) > 0 and (datetime_series.notna().sum() / len(df[col])) > 0.5:
-                    df[col] = datetime_series
-                    invalid_count = int(datetime_series.isna().sum())
-                    if invalid_count > 0:
-                        self._record_issue(
-                            "invalid_datetime",
-                            f"Standardized dates in '{col}', {invalid_count} invalid entries set to NaT",
-                        )
-                    self._record_step(f"Converted column '{col}' to datetime")
-                    self._increment_metric("datetime_conversions", int(datetime_series.notna().sum()))
+        object_columns = df.select_dtypes(include="object").columns
+        if len(df) == 0 or object_columns.empty:
+            return df
+
+        # Coerce all object columns in one pass and keep the ones that are mostly numeric
+        numeric = df[object_columns].apply(pd.to_numeric, errors="coerce")
+        numeric_counts = numeric.notna().sum()
+        numeric_columns = numeric_counts.index[numeric_counts / len(df) > 0.8]
+
+        # Only what is left is tried as datetime; those columns need more than half parseable values
+        remaining = object_columns[~object_columns.isin(numeric_columns)]
+        datetimes = df[remaining].apply(pd.to_datetime, errors="coerce")
+        datetime_counts = datetimes.notna().sum()
+        datetime_columns = datetime_counts.index[datetime_counts / len(df) > 0.5]
+
+        for col in remaining[~remaining.isin(datetime_columns)]:
+            self._datetime_parses[col] = (datetimes[col], df[col])
+
+        df[numeric_columns] = numeric[numeric_columns]
+        df[datetime_columns] = datetimes[datetime_columns]
+
+        # Record per column in the frame's order, as a column-by-column pass would
+        for col in object_columns:
+            if col in numeric_columns:
+                self._record_step(f"Converted column '{col}' to numeric")
+                self._increment_metric("numeric_conversions", int(numeric_counts[col]))
+            elif col in datetime_columns:
+                invalid_count = len(df) - int(datetime_counts[col])
+                if invalid_count > 0:
+                    self._record_issue(
+                        "invalid_datetime",
+                        f"Standardized dates in '{col}', {invalid_count} invalid entries set to NaT",
+                    )
+                self._record_step(f"Converted column '{col}' to datetime")
+                self._increment_metric("datetime_conversions", int(datetime_counts[col]))
         return df
 
     def _handle_missing_values(self, df: pd.DataFrame) -> pd.DataFrame:
         """Fill or drop missing values based on column type"""
+        # Columns are filled in batches; a batch is flushed before each row drop so later
+        # columns still see their statistics computed on the rows that survived it
+        pending: List[str] = []
         for col in df.columns:
+            if str(df[col].dtype) in MEDIAN_FILL_DTYPES or df[col].dtype == "object":
+                pending.append(col)
+                continue
+
             missing_count = int(df[col].isnull().sum())
             if missing_count == 0:
                 continue
 
-            if str(df[col].dtype) in ["int64", "float64", "Int64", "Float64"]:
-                median_val = df[col].median()
-                df[col] = df[col].fillna(median_val)
-                self._record_issue(
-                    "missing_values",
-                    f"Filled {missing_count} missing values in '{col}' with median ({median_val})",
-                )
-                self._increment_metric("filled_null_values", missing_count)
-            elif df[col].dtype == "object":
-                mode_val = df[col].mode(dropna=True)
-                fill_val = mode_val.iloc[0] if not mode_val.empty else "Unknown"
-                df[col] = df[col].fillna(fill_val)
+            df = self._fill_missing_values(df, pending)
+            pending = []
+
+            before_rows = len(df)
+            df = df.dropna(subset=[col])
+            rows_removed = before_rows - len(df)
+            if rows_removed > 0:
                 self._record_issue(
                     "missing_values",
-                    f"Filled {missing_count} missing values in '{col}' with '{fill_val}'",
+                    f"Dropped {rows_removed} rows due to >50% missing data in '{col}'",
                 )
-                self._increment_metric("filled_null_values", missing_count)
-            else:
-                before_rows = len(df)
-                df = df.dropna(subset=[col])
-                rows_removed = before_rows - len(df)
-                if rows_removed > 0:
-                    self._record_issue(
-                        "missing_values",
-                        f"Dropped {rows_removed} rows due to >50% missing data in '{col}'",
-                    )
-                    self._increment_metric("rows_dropped", rows_removed)
+                self._increment_metric("rows_dropped", rows_removed)
 
             self._record_step(f"Handled missing values in '{col}' ({missing_count} values)")
 
+        return self._fill_missing_values(df, pending)
+
+    def _fill_missing_values(self, df: pd.DataFrame, columns: List[str]) -> pd.DataFrame:
+        """Fill numeric columns with their median and text columns with their mode, in one pass per kind"""
+        if not columns:
+            return df
+        missing_counts = df[columns].isnull().sum()
+        columns = [col for col in columns if missing_counts[col] > 0]
+        if not columns:
+            return df
+
+        numeric_columns = [col for col in columns if str(df[col].dtype) in MEDIAN_FILL_DTYPES]
+        text_columns = [col for col in columns if col not in numeric_columns]
+
+        fill_values: Dict[str, Any] = {}
+        if numeric_columns:
+            fill_values.update(df[numeric_columns].median().items())
+        if text_columns:
+            modes = df[text_columns].mode(dropna=True)
+            first_modes = modes.iloc[0] if len(modes) else pd.Series(index=text_columns, dtype=object)
+            fill_values.update(first_modes.fillna("Unknown").items())
+
+        df[columns] = df[columns].fillna(fill_values)
+
+        for col in columns:
+            missing_count = int(missing_counts[col])
+            if col in numeric_columns:
+                message = f"Filled {missing_count} missing values in '{col}' with median ({fill_values[col]})"
+            else:
+                message = f"Filled {missing_count} missing values in '{col}' with '{fill_values[col]}'"
+            self._record_issue("missing_values", message)
+            self._increment_metric("filled_null_values", missing_count)
+            self._record_step(f"Handled missing values in '{col}' ({missing_count} values)")
         return df
 
     def _standardize_dates(self, df: pd.DataFrame) -> pd.DataFrame:
         """Standardize date columns to datetime for non-object types that slipped through"""
         for col in df.columns:
             if df[col].dtype == "object":
-                converted = pd.to_datetime(df[col], errors="coerce")
+                converted = self._reuse_datetime_parse(df, col)
+                if converted is None:
+                    converted = pd.to_datetime(df[col], errors="coerce")
                 if converted.notna().sum() > 0:
                     invalid_count = int(converted.isna().sum())
                     df[col] = converted
@@ -196,6 +244,19 @@ class DataCleaner:
                     self._increment_metric("datetime_conversions", int(converted.notna().sum()))
         return df
 
+    def _reuse_datetime_parse(self, df: pd.DataFrame, col: str) -> Optional[pd.Series]:
+        """Return the column's datetime parse from _standardize_data_types if the column is unchanged since"""
+        cached = self._datetime_parses.pop(col, None)
+        if cached is None:
+            return None
+        parsed, original = cached
+
+        # A fill, trim or dropped row since the type pass means the cached parse no longer matches
+        current = df[col]
+        if not (original.index.equals(current.index) and original.equals(current)):
+            return None
+        return parsed
+
     def _remove_duplicates(self, df: pd.DataFrame) -> pd.DataFrame:
         """Remove duplicate rows"""
         initial_len = len(df)
@@ -212,9 +273,17 @@ class DataCleaner:
         text_columns = df.select_dtypes(include=["object"]).columns
         for col in text_columns:
             series = df[col]
-            trimmed_series = series.apply(lambda value: value.strip() if isinstance(value, str) else value)
-            changes = int((series.fillna("__nan__") != trimmed_series.fillna("__nan__")).sum())
+            try:
+                stripped = series.str.strip()
+            except AttributeError:
+                # Object column without any strings (e.g. plain ints or bools); nothing to trim
+                continue
+            # .str yields NaN for non-strings, and a stripped string is never NaN
+            is_text = stripped.notna()
+            changed = is_text & (stripped != series)
+            changes = int(changed.sum())
             if changes > 0:
+                trimmed_series = stripped.where(is_text, series)
                 df[col] = trimmed_series
                 self._record_step(f"Trimmed text values in '{col}' ({changes} cells updated)")
                 self._increment_metric("text_standardized", changes)
@@ -4,9 +4,10 @@ Google Gemini AI Service for Natural Language Query Processing
 
 import os
 import json
+import re
 import pandas as pd
 import google.generativeai as genai
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Iterator, Optional, Tuple
 from dotenv import load_dotenv
 import logging
 from ..utils.database import execute_sql, get_table_schema
@@ -52,35 +53,55 @@ class GeminiService:
         Returns:
             Dictionary containing SQL query, results, and visualizations
         """
+        result: Dict[str, Any] = {}
+        for _, result in self.stream_ai_query(request, table_name, engine):
+            pass
+        return result
+
+    def stream_ai_query(self, request: Dict[str, Any], table_name: str, engine) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        """
+        Execute AI-powered query on dynamic table, yielding each stage as soon as it is ready
+
+        Args:
+            request: Query request with query_text, file_id, context
+            table_name: Name of the dynamic table
+            engine: Database engine
+
+        Yields:
+            (event, data) pairs for "sql", "results" and "visualizations", ending with either
+            ("completed", full response) or ("error", error response)
+        """
+        query_text = request.get("query", "")
         try:
-            query_text = request.get("query", "")
             context = request.get("context", "")
             cleaning_metadata = request.get("cleaning_metadata")
 
             schema = get_table_schema(table_name, engine)
             sql_query = sql_generator.generate_query(query_text, schema, table_name, context)
+            yield "sql", {"sql_query": sql_query}
+
             result_df = execute_sql(table_name, sql_query, engine)
+            executed_results = {
+                "data": result_df.to_dict("records"),
+                "columns": [{"name": col, "type": str(result_df[col].dtype)} for col in result_df.columns],
+                "row_count": len(result_df),
+            }
+            yield "results", {"executed_results": executed_results}
 
             viz_configs = sql_generator.generate_visualizations(
                 query_text,
-                {
-                    "columns": [{"name": col, "type": str(result_df[col].dtype)} for col in result_df.columns],
-                    "data": result_df.to_dict("records"),
-                },
+                {"columns": executed_results["columns"], "data": executed_results["data"]},
                 schema,
             )
+            yield "visualizations", {"visualizations": viz_configs}
 
             explanation = self._generate_explanation(query_text, result_df, sql_query)
 
-            return {
+            yield "completed", {
                 "status": "completed",
                 "query": query_text,
                 "sql_query": sql_query,
-                "executed_results": {
-                    "data": result_df.to_dict("records"),
-                    "columns": [{"name": col, "type": str(result_df[col].dtype)} for col in result_df.columns],
-                    "row_count": len(result_df),
-                },
+                "executed_results": executed_results,
                 "visualizations": viz_configs,
                 "explanation": explanation,
                 "data_quality_disclaimer": self._check_data_quality(result_df, cleaning_metadata),
@@ -88,7 +109,7 @@ class GeminiService:
 
         except Exception as e:
             logger.error(f"Error executing AI query: {str(e)}")
-            return {
+            yield "error", {
                 "status": "error",
                 "query": query_text,
                 "error": str(e)
@@ -186,7 +207,6 @@ Be specific and actionable in your analysis. Focus on the most relevant informat
         try:
             # Try to extract JSON from the response
             # Look for JSON-like content in the response
-            import re
             json_match = re.search(r'\{.*\}', response_text, re.DOTALL)
 
             if json_match:
@@ -264,7 +284,6 @@ Provide the response as JSON:
             )
 
             # Parse the response
-            import re
             json_match = re.search(r'\{.*\}', response.text, re.DOTALL)
 
             if json_match:
@@ -11,6 +11,19 @@ import os
 
 load_dotenv()
 
+# Budget for caller-supplied context in the prompt, estimated at ~4 characters per token
+MAX_CONTEXT_TOKENS = 1000
+
+
+def _bound_context(context: Optional[str], max_tokens: int = MAX_CONTEXT_TOKENS) -> str:
+    """Keep the most recent part of the context so prompt size stays flat however long a session runs"""
+    if not context:
+        return ""
+    max_chars = max_tokens * 4
+    if len(context) <= max_chars:
+        return context
+    return context[-max_chars:]
+
 
 class SQLGenerator:
     """Service for generating SQL queries from natural language using Gemini AI"""
@@ -53,7 +66,7 @@ Database Schema:
 
 Natural Language Query: {nl_query}
 
-{context or ""}
+{_bound_context(context)}
 
 Instructions:
 - Generate ONLY a SELECT statement (no INSERT, UPDATE, DELETE, DROP, etc.)
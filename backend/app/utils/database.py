@@ -4,10 +4,14 @@ Database utilities for dynamic table creation and management
 
 import re
 import hashlib
-from typing import Dict, List, Any, Optional
+import threading
+from collections import OrderedDict
+from typing import Dict, Iterator, List, Any, Optional, Tuple, Union
 from sqlalchemy import Column, Integer, String, DateTime, Float, Boolean, Text, Table, MetaData
+from sqlalchemy.engine import Connection
 from sqlalchemy.sql import func
 from ..core.config import engine
+from .retry import retry_on_sqlite_busy
 import pandas as pd
 from datetime import datetime
 
@@ -27,6 +31,11 @@ FORBIDDEN_SQL_TOKENS = {
 }
 COMMENT_TOKENS = ("--", "/*", "//")
 
+# Column schemas per (database URL, table name); dynamic tables are not altered once loaded
+TABLE_SCHEMA_CACHE_SIZE = 256
+_table_schema_cache: "OrderedDict[Tuple[str, str], Dict[str, str]]" = OrderedDict()
+_table_schema_cache_lock = threading.Lock()
+
 class DynamicTableManager:
     """Manages dynamic table creation based on Excel structures"""
 
@@ -220,7 +229,7 @@ class DynamicTableManager:
         return hash_md5.hexdigest()
 
 def create_dynamic_table_from_schema(schema: Dict[str, Any], engine) -> str:
-    """Create a dynamic table from schema dict"""
+    """Create a dynamic table from schema dict, inside the caller's transaction when given a Connection"""
     table_name = schema['table_name']
     columns = schema['columns']
 
@@ -250,10 +259,15 @@ def create_dynamic_table_from_schema(schema: Dict[str, Any], engine) -> str:
 
     for attempt in range(max_retries):
         try:
-            # Use the engine directly with exec_driver_sql for DDL
-            with engine.connect() as conn:
-                conn.exec_driver_sql(sql)
-                conn.commit()
+            if isinstance(engine, Connection):
+                # SQLite DDL is transactional, so the caller's commit or rollback covers the table too
+                engine.exec_driver_sql(sql)
+            else:
+                # Use the engine directly with exec_driver_sql for DDL
+                with engine.connect() as conn:
+                    conn.exec_driver_sql(sql)
+                    conn.commit()
+            clear_table_schema_cache(table_name)
             return table_name
         except Exception as e:
             if "database is locked" in str(e) and attempt < max_retries - 1:
@@ -265,7 +279,7 @@ def create_dynamic_table_from_schema(schema: Dict[str, Any], engine) -> str:
 
 
 def insert_dataframe_to_table(df: pd.DataFrame, table_name: str, engine, file_id: int = None) -> int:
-    """Insert DataFrame into dynamic table"""
+    """Insert DataFrame into dynamic table, inside the caller's transaction when given a Connection"""
     # Retry logic for SQLite locking issues
     max_retries = 3
     retry_delay = 0.1
@@ -277,9 +291,12 @@ def insert_dataframe_to_table(df: pd.DataFrame, table_name: str, engine, file_id
             df_copy['file_id'] = file_id
             df_copy['row_index'] = range(len(df_copy))
 
-            # Insert data with explicit transaction management
-            with engine.begin() as connection:
-                df_copy.to_sql(table_name, connection, if_exists='append', index=False)
+            if isinstance(engine, Connection):
+                df_copy.to_sql(table_name, engine, if_exists='append', index=False)
+            else:
+                # Insert data with explicit transaction management
+                with engine.begin() as connection:
+                    df_copy.to_sql(table_name, connection, if_exists='append', index=False)
             return len(df_copy)
         except Exception as e:
             if "database is locked" in str(e) and attempt < max_retries - 1:
@@ -290,9 +307,26 @@ def insert_dataframe_to_table(df: pd.DataFrame, table_name: str, engine, file_id
             raise
 
 
+def clear_table_schema_cache(table_name: Optional[str] = None) -> None:
+    """Drop cached schemas for one table, or all of them when no table_name is given"""
+    with _table_schema_cache_lock:
+        if table_name is None:
+            _table_schema_cache.clear()
+            return
+        for key in [key for key in _table_schema_cache if key[1] == table_name]:
+            del _table_schema_cache[key]
+
+
 def get_table_schema(table_name: str, engine) -> Dict[str, str]:
     """Get column schema for a table as dict of column_name: type"""
     try:
+        cache_key = (str(engine.url), table_name)
+        with _table_schema_cache_lock:
+            cached = _table_schema_cache.get(cache_key)
+            if cached is not None:
+                _table_schema_cache.move_to_end(cache_key)
+                return dict(cached)
+
         with engine.connect() as conn:
             result = conn.exec_driver_sql(f"PRAGMA table_info({table_name})")
             schema = {}
@@ -302,11 +336,18 @@ def get_table_schema(table_name: str, engine) -> Dict[str, str]:
                 # Skip metadata columns
                 if col_name not in ['id', 'file_id', 'created_at', 'updated_at', 'row_index']:
                     schema[col_name] = col_type
-            return schema
     except Exception as e:
         print(f"Error getting schema for {table_name}: {e}")
         return {}
 
+    # An empty result means the table does not exist (yet), so it is looked up again next time
+    if schema:
+        with _table_schema_cache_lock:
+            _table_schema_cache[cache_key] = schema
+            if len(_table_schema_cache) > TABLE_SCHEMA_CACHE_SIZE:
+                _table_schema_cache.popitem(last=False)
+    return dict(schema)
+
 
 def _sanitize_sql(sql: str) -> str:
     """Basic SQL sanitization to remove comments and enforce SELECT only."""
@@ -329,11 +370,24 @@ def _sanitize_sql(sql: str) -> str:
     return stripped
 
 
-def execute_sql(table_name: str, sql: str, engine) -> pd.DataFrame:
-    """Execute sanitized SQL query on dynamic table"""
+@retry_on_sqlite_busy(max_attempts=3)
+def execute_sql(
+    table_name: str,
+    sql: str,
+    engine,
+    chunksize: Optional[int] = None,
+) -> Union[pd.DataFrame, Iterator[pd.DataFrame]]:
+    """
+    Execute sanitized SQL query on dynamic table, yielding DataFrame chunks when chunksize is set.
+
+    Busy errors are retried for the eager call only; chunks are fetched as the caller iterates,
+    outside retry_on_sqlite_busy.
+    """
     try:
         sanitized_sql = _sanitize_sql(sql)
         safe_sql = sanitized_sql.replace('FROM data', f'FROM {table_name}').replace('from data', f'from {table_name}')
+        if chunksize:
+            return pd.read_sql(safe_sql, engine, chunksize=chunksize)
         return pd.read_sql(safe_sql, engine)
     except Exception as e:
         print(f"Error executing SQL: {e}")
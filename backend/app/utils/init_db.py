@@ -2,10 +2,12 @@
 Database initialization script
 """
 
+from sqlalchemy import inspect, text
+
 from ..core.config import Base, engine
 from ..models.base import (
     UploadedFile, FileSheet, SheetColumn,
-    DataQualityIssue, QueryHistory
+    DataQualityIssue, QueryHistory, CHAT_MESSAGE_SEARCH_DDL
 )
 from .database import table_manager
 
@@ -15,6 +17,15 @@ def create_tables():
         # Create base tables
         Base.metadata.create_all(bind=engine)
 
+        # create_all skips tables that already exist, so add any columns and indexes they are missing
+        add_missing_columns()
+        for table in Base.metadata.sorted_tables:
+            for index in table.indexes:
+                index.create(bind=engine, checkfirst=True)
+        backfill_chat_session_stats()
+        convert_legacy_file_hashes()
+        add_chat_message_search()
+
         # Create any additional dynamic table infrastructure if needed
         table_manager.create_tables()
 
@@ -25,6 +36,58 @@ def create_tables():
         print(f"❌ Error creating database tables: {e}")
         return False
 
+def add_missing_columns():
+    """Add nullable model columns that older databases were created without"""
+    with engine.begin() as conn:
+        # Inspect on the same connection; a second one would wait on this transaction's write lock
+        inspector = inspect(conn)
+        for table in Base.metadata.sorted_tables:
+            existing = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing or not column.nullable:
+                    continue
+                column_type = column.type.compile(dialect=engine.dialect)
+                conn.execute(text(f'ALTER TABLE "{table.name}" ADD COLUMN "{column.name}" {column_type}'))
+
+def backfill_chat_session_stats():
+    """Fill denormalized message counts and previews for sessions that predate them"""
+    with engine.begin() as conn:
+        conn.execute(text("""
+            UPDATE chat_sessions SET
+                message_count = (
+                    SELECT COUNT(*) FROM chat_messages WHERE chat_messages.session_id = chat_sessions.id
+                ),
+                assistant_preview = (
+                    SELECT substr(content, 1, 101) FROM chat_messages
+                    WHERE chat_messages.session_id = chat_sessions.id AND role = 'assistant'
+                    ORDER BY created_at DESC, id DESC LIMIT 1
+                )
+            WHERE message_count IS NULL
+        """))
+
+def convert_legacy_file_hashes():
+    """Rewrite file hashes that older versions stored as hex text into raw digests"""
+    if engine.dialect.name != "sqlite":
+        return
+    with engine.begin() as conn:
+        rows = conn.execute(text(
+            "SELECT id, file_hash FROM uploaded_files WHERE typeof(file_hash) = 'text'"
+        )).all()
+        if rows:
+            # unhex() needs SQLite 3.41, so decode in Python
+            conn.execute(
+                text("UPDATE uploaded_files SET file_hash = :file_hash WHERE id = :id"),
+                [{"id": row.id, "file_hash": bytes.fromhex(row.file_hash)} for row in rows],
+            )
+
+def add_chat_message_search():
+    """Create and fill the message search index on databases whose chat_messages table predates it"""
+    if engine.dialect.name != "sqlite" or "chat_messages_fts" in inspect(engine).get_table_names():
+        return
+    with engine.begin() as conn:
+        for statement in CHAT_MESSAGE_SEARCH_DDL:
+            conn.execute(text(statement))
+
 def drop_tables():
     """Drop all database tables (for development/testing)"""
     try:
@@ -0,0 +1,52 @@
+"""
+Retry helpers for transient SQLite lock contention
+"""
+
+import random
+import sqlite3
+import time
+from functools import wraps
+from typing import Callable
+
+from sqlalchemy.exc import OperationalError
+
+BUSY_ERROR_MESSAGES = ("database is locked", "database is busy")
+
+
+def is_sqlite_busy_error(exc: BaseException) -> bool:
+    """Return True only for SQLITE_BUSY/SQLITE_LOCKED style errors, not read-only or schema errors"""
+    if not isinstance(exc, (OperationalError, sqlite3.OperationalError)):
+        return False
+    message = str(exc).lower()
+    return any(busy_message in message for busy_message in BUSY_ERROR_MESSAGES)
+
+
+def retry_on_sqlite_busy(max_attempts: int = 3, base_delay: float = 0.05, backoff: float = 3.0) -> Callable:
+    """
+    Retry the wrapped call when SQLite reports the database as locked
+
+    Only the call itself is retried. If it returns a lazy iterator, such as
+    pd.read_sql with chunksize, errors raised while the caller consumes it
+    are not retried.
+
+    Args:
+        max_attempts: Total number of attempts, including the first call
+        base_delay: Delay in seconds before the first retry
+        backoff: Multiplier applied to the delay after each retry (50/150/450 ms by default)
+
+    Returns:
+        Decorator that re-raises the last error once attempts are exhausted
+    """
+    def decorator(func: Callable) -> Callable:
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            for attempt in range(max_attempts):
+                try:
+                    return func(*args, **kwargs)
+                except Exception as e:
+                    if not is_sqlite_busy_error(e) or attempt == max_attempts - 1:
+                        raise
+                    delay = base_delay * (backoff ** attempt)
+                    time.sleep(delay + random.uniform(0, delay / 2))
+        return wrapper
+    return decorator
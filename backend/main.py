@@ -17,32 +17,35 @@ from fastapi import (
     UploadFile,
 )
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import FileResponse, JSONResponse, ORJSONResponse
 from sqlalchemy import text
 from sqlalchemy.exc import SQLAlchemyError
-from sqlalchemy.orm import Session
+from sqlalchemy.orm import Session, undefer, undefer_group
 
+from anyio import to_thread
 from dotenv import load_dotenv
 
-from app.core.config import engine, get_db, settings
+from app.core.config import ReadSessionLocal, get_db, read_engine, settings, warm_up_pools
 from app.models.base import (
     UploadedFile as UploadedFileModel,
     FileSheet,
     SheetColumn,
     DataQualityIssue,
     QueryHistory,
-    ChatSession,
-    ChatMessage,
 )
-from app.models.schemas import AIQueryRequest, ChatMessageResponse, ChatSessionSummary
-from app.routers.ai import router as ai_router
+from app.routers.ai import (
+    clear_generated_sql_cache,
+    clear_table_name_cache,
+    router as ai_router,
+    warm_table_name_cache,
+)
 from app.routers.chat import router as chat_router
-from app.services import chat_service
 from app.services.excel_processor import excel_processor
 from app.services.gemini_service import get_gemini_service
 from app.utils.database import (
+    clear_table_schema_cache,
     create_dynamic_table_from_schema,
-    execute_sql,
     get_table_schema,
     insert_dataframe_to_table,
 )
@@ -60,6 +63,7 @@ app = FastAPI(
     title="AI Data Agent API",
     description="Backend service for Excel ingestion, AI-driven analytics, and visualization payloads.",
     version="1.0.0",
+    default_response_class=ORJSONResponse,
 )
 
 app.add_middleware(
@@ -69,11 +73,41 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+# Query results are large and highly compressible JSON; small bodies are not worth compressing
+app.add_middleware(GZipMiddleware, minimum_size=1024)
 
 # Include routers
 app.include_router(ai_router)
 app.include_router(chat_router)
 
+
+@app.on_event("startup")
+async def configure_threadpool() -> None:
+    """Size the threadpool that runs blocking (def) handlers such as the AI routes."""
+    to_thread.current_default_thread_limiter().total_tokens = settings.THREADPOOL_SIZE
+
+
+@app.on_event("startup")
+def warm_up_database() -> None:
+    """Open pooled connections and prime the AI table-name cache before serving traffic."""
+    try:
+        warm_up_pools(settings.POOL_WARMUP)
+        with ReadSessionLocal() as db:
+            warm_table_name_cache(db)
+    except Exception as exc:
+        # A cold pool is slower, not broken; never block startup on warm-up
+        print(f"Database warm-up skipped: {exc}")
+
+
+@app.on_event("startup")
+def warm_up_ai_service() -> None:
+    """Build the shared Gemini client once so the first chat turn does not pay for SDK setup."""
+    try:
+        get_gemini_service()
+    except Exception as exc:
+        # Without GEMINI_API_KEY the AI routes report the error per request; the rest of the API still serves
+        print(f"Gemini warm-up skipped: {exc}")
+
 # --------------------------------------------------------------------------- #
 # Utility helpers
 # --------------------------------------------------------------------------- #
@@ -88,27 +122,9 @@ def _ensure_excel_extension(filename: str) -> None:
         )
 
 
-def _calculate_file_hash(content: bytes) -> str:
-    """Return a SHA-256 hash for duplicate detection."""
-    hasher = hashlib.sha256()
-    hasher.update(content)
-    return hasher.hexdigest()
-
-
-def _resolve_primary_sheet(file_record: UploadedFileModel, db: Session) -> Tuple[FileSheet, str]:
-    """Resolve the primary sheet for a file, return FileSheet and table name."""
-    primary_sheet: Optional[str] = (file_record.sheet_names or [None])[0]
-    sheet_query = db.query(FileSheet).filter(FileSheet.file_id == file_record.id)
-
-    if primary_sheet:
-        sheet_obj = sheet_query.filter(FileSheet.sheet_name == primary_sheet).first()
-    else:
-        sheet_obj = sheet_query.order_by(FileSheet.id).first()
-
-    if not sheet_obj:
-        raise HTTPException(status_code=400, detail="No sheet metadata found for file.")
-
-    return sheet_obj, sheet_obj.table_name
+def _calculate_file_hash(content: bytes) -> bytes:
+    """Return the raw SHA-256 digest used for duplicate detection."""
+    return hashlib.sha256(content).digest()
 
 
 def _serialize_sheet(sheet: FileSheet) -> Dict[str, Any]:
@@ -174,7 +190,8 @@ def _fetch_table_preview(
         """
     )
 
-    with engine.connect() as connection:
+    # Read-only connection, so callers holding a write session do not wait on their own lock
+    with read_engine.connect() as connection:
         result = connection.execute(preview_query, {"file_id": file_id, "limit": rows})
         mappings = result.mappings().all()
 
@@ -339,7 +356,7 @@ async def health_check() -> Dict[str, Any]:
 
 
 @app.post("/upload/avatar", response_model=Dict[str, Any])
-async def upload_avatar(
+def upload_avatar(
     file: UploadFile = File(...),
     db: Session = Depends(get_db),
 ) -> Dict[str, Any]:
@@ -357,8 +374,8 @@ async def upload_avatar(
             detail="File must be an image.",
         )
 
-    # Validate file size (max 5MB)
-    content = await file.read()
+    # Validate file size (max 5MB); a sync handler reads the spooled upload directly
+    content = file.file.read()
     if len(content) > 5 * 1024 * 1024:
         raise HTTPException(
             status_code=400,
@@ -394,7 +411,7 @@ async def upload_avatar(
 
 
 @app.get("/avatars/{filename}")
-async def get_avatar(filename: str):
+def get_avatar(filename: str):
     """
     Serve uploaded avatar images.
     """
@@ -404,12 +421,11 @@ async def get_avatar(filename: str):
     if not os.path.exists(file_path):
         raise HTTPException(status_code=404, detail="Avatar not found")
 
-    from fastapi.responses import FileResponse
     return FileResponse(file_path)
 
 
 @app.post("/upload", response_model=Dict[str, Any])
-async def upload_file(
+def upload_file(
     file: UploadFile = File(...),
     db: Session = Depends(get_db),
 ) -> Dict[str, Any]:
@@ -431,7 +447,7 @@ async def upload_file(
     file_path = os.path.join(uploads_dir, unique_filename)
 
     try:
-        content = await file.read()
+        content = file.file.read()
         with open(file_path, "wb") as output_file:
             output_file.write(content)
 
@@ -503,12 +519,13 @@ async def upload_file(
             unique_table_name = f"file_{uploaded_file.id}_sheet_{index}_{schema['base_table_name']}"
             schema['table_name'] = unique_table_name
 
-            # Create dynamic table and insert cleaned data (these operations have their own retry logic)
-            table_name = create_dynamic_table_from_schema(schema, engine)
+            # Create the dynamic table and insert cleaned data on the session's connection,
+            # so the tables commit or roll back together with the file metadata
+            table_name = create_dynamic_table_from_schema(schema, db.connection())
             insert_dataframe_to_table(
                 sanitized_df,
                 table_name,
-                engine,
+                db.connection(),
                 file_id=uploaded_file.id,
             )
 
@@ -554,6 +571,30 @@ async def upload_file(
             }
             sheet_summaries.append(sheet_summary)
 
+        # Build the response before committing; reading the row afterwards would reload it
+        # and reopen a write transaction that stays held until the session closes
+        response_payload = {
+            "message": "File uploaded and processed successfully.",
+            "file_id": uploaded_file.id,
+            "filename": uploaded_file.original_filename,
+            "unique_filename": uploaded_file.filename,
+            "size": uploaded_file.file_size,
+            "file_hash": uploaded_file.file_hash.hex(),
+            "validation": validation_result,
+            "sheet_names": sheet_names,
+            "sheet_summaries": sheet_summaries,
+            "processing_time_seconds": uploaded_file.processing_time_seconds,
+            "status": "success",
+        }
+
+        primary_summary = next((summary for summary in sheet_summaries if summary["sheet_name"] == primary_sheet_key), None)
+        if primary_summary:
+            response_payload["processed_data"] = {
+                "dataframe_info": primary_summary["dataframe_info"],
+                "numeric_stats": primary_summary["numeric_stats"],
+                "column_analysis": primary_summary["column_analysis"],
+            }
+
         # Add all records in a single transaction
         try:
             db.add_all(sheet_models)
@@ -574,39 +615,12 @@ async def upload_file(
             db.add_all(quality_issues_to_add)
             db.commit()
         except Exception as e:
+            # The rollback also drops the dynamic tables created in this transaction
             db.rollback()
-            # Clean up any created tables if transaction fails
             for sheet_model in sheet_models:
-                try:
-                    with engine.connect() as conn:
-                        conn.exec_driver_sql(f'DROP TABLE IF EXISTS "{sheet_model.table_name}"')
-                        conn.commit()
-                except:
-                    pass  # Ignore cleanup errors
+                clear_table_schema_cache(sheet_model.table_name)
             raise e
 
-        response_payload = {
-            "message": "File uploaded and processed successfully.",
-            "file_id": uploaded_file.id,
-            "filename": uploaded_file.original_filename,
-            "unique_filename": uploaded_file.filename,
-            "size": uploaded_file.file_size,
-            "file_hash": uploaded_file.file_hash,
-            "validation": validation_result,
-            "sheet_names": sheet_names,
-            "sheet_summaries": sheet_summaries,
-            "processing_time_seconds": uploaded_file.processing_time_seconds,
-            "status": "success",
-        }
-
-        primary_summary = next((summary for summary in sheet_summaries if summary["sheet_name"] == primary_sheet_key), None)
-        if primary_summary:
-            response_payload["processed_data"] = {
-                "dataframe_info": primary_summary["dataframe_info"],
-                "numeric_stats": primary_summary["numeric_stats"],
-                "column_analysis": primary_summary["column_analysis"],
-            }
-
         return response_payload
 
     except HTTPException:
@@ -618,11 +632,11 @@ async def upload_file(
         db.rollback()
         raise HTTPException(status_code=500, detail=f"Upload failed: {str(exc)}")
     finally:
-        await file.close()
+        file.file.close()
 
 
 @app.get("/files", response_model=Dict[str, Any])
-async def list_files(
+def list_files(
     skip: int = Query(0, ge=0),
     limit: int = Query(100, ge=1, le=1000),
     db: Session = Depends(get_db),
@@ -630,6 +644,7 @@ async def list_files(
     """List previously uploaded files with pagination."""
     files = (
         db.query(UploadedFileModel)
+        .options(undefer(UploadedFileModel.sheet_names))
         .order_by(UploadedFileModel.created_at.desc())
         .offset(skip)
         .limit(limit)
@@ -660,27 +675,37 @@ async def list_files(
 
 
 @app.get("/files/{file_id}", response_model=Dict[str, Any])
-async def get_file(file_id: int, db: Session = Depends(get_db)) -> Dict[str, Any]:
+def get_file(file_id: int, db: Session = Depends(get_db)) -> Dict[str, Any]:
     """Retrieve detailed metadata for a single uploaded file."""
     file_record: Optional[UploadedFileModel] = (
-        db.query(UploadedFileModel).filter(UploadedFileModel.id == file_id).first()
+        db.query(UploadedFileModel)
+        .options(undefer_group("file_metadata"))
+        .filter(UploadedFileModel.id == file_id)
+        .first()
     )
     if not file_record:
         raise HTTPException(status_code=404, detail="File not found.")
 
-    sheets = db.query(FileSheet).filter(FileSheet.file_id == file_id).all()
+    sheets = db.query(FileSheet).filter(FileSheet.file_id == file_id).order_by(FileSheet.id).all()
+
+    # Fetch every sheet's columns in one query instead of one query per sheet
+    columns_by_sheet: Dict[int, List[SheetColumn]] = {}
+    all_columns = (
+        db.query(SheetColumn)
+        .options(undefer(SheetColumn.cleaning_applied))
+        .filter(SheetColumn.file_id == file_id)
+        .order_by(SheetColumn.sheet_id, SheetColumn.column_index)
+        .all()
+    )
+    for column in all_columns:
+        columns_by_sheet.setdefault(column.sheet_id, []).append(column)
+
     sheet_payload = []
     for sheet in sheets:
-        columns = (
-            db.query(SheetColumn)
-            .filter(SheetColumn.file_id == file_id, SheetColumn.sheet_id == sheet.id)
-            .order_by(SheetColumn.column_index)
-            .all()
-        )
         sheet_payload.append(
             {
                 **_serialize_sheet(sheet),
-                "columns": [_serialize_column(column) for column in columns],
+                "columns": [_serialize_column(column) for column in columns_by_sheet.get(sheet.id, [])],
                 "cleaning_metadata": (file_record.cleaning_metadata or {}).get(sheet.sheet_name)
                 if file_record.cleaning_metadata
                 else None,
@@ -693,7 +718,7 @@ async def get_file(file_id: int, db: Session = Depends(get_db)) -> Dict[str, Any
         "original_filename": file_record.original_filename,
         "file_path": file_record.file_path,
         "file_size": file_record.file_size,
-        "file_hash": file_record.file_hash,
+        "file_hash": file_record.file_hash.hex(),
         "mime_type": file_record.mime_type,
         "status": file_record.status,
         "total_rows": file_record.total_rows,
@@ -714,16 +739,21 @@ async def get_file(file_id: int, db: Session = Depends(get_db)) -> Dict[str, Any
         response["processed_data"] = {
             "preview_columns": columns,
             "preview_rows": data,
-            "schema": get_table_schema(file_record.dynamic_table_name, engine),
+            "schema": get_table_schema(file_record.dynamic_table_name, read_engine),
         }
 
     return response
 
 
 @app.get("/files/{file_id}/metadata", response_model=Dict[str, Any])
-async def get_file_metadata(file_id: int, db: Session = Depends(get_db)) -> Dict[str, Any]:
+def get_file_metadata(file_id: int, db: Session = Depends(get_db)) -> Dict[str, Any]:
     """Return dataset-level metadata, including sheet names and cleaning scores."""
-    file_record = db.query(UploadedFileModel).filter(UploadedFileModel.id == file_id).first()
+    file_record = (
+        db.query(UploadedFileModel)
+        .options(undefer_group("file_metadata"))
+        .filter(UploadedFileModel.id == file_id)
+        .first()
+    )
     if not file_record:
         raise HTTPException(status_code=404, detail="File not found.")
 
@@ -737,7 +767,7 @@ async def get_file_metadata(file_id: int, db: Session = Depends(get_db)) -> Dict
 
 
 @app.get("/files/{file_id}/sheets", response_model=Dict[str, Any])
-async def list_file_sheets(file_id: int, db: Session = Depends(get_db)) -> Dict[str, Any]:
+def list_file_sheets(file_id: int, db: Session = Depends(get_db)) -> Dict[str, Any]:
     """List sheets and their high-level metadata for a file."""
     sheets = db.query(FileSheet).filter(FileSheet.file_id == file_id).order_by(FileSheet.id).all()
     if not sheets:
@@ -747,7 +777,7 @@ async def list_file_sheets(file_id: int, db: Session = Depends(get_db)) -> Dict[
 
 
 @app.get("/files/{file_id}/sheets/{sheet_id}", response_model=Dict[str, Any])
-async def get_sheet_detail(file_id: int, sheet_id: int, db: Session = Depends(get_db)) -> Dict[str, Any]:
+def get_sheet_detail(file_id: int, sheet_id: int, db: Session = Depends(get_db)) -> Dict[str, Any]:
     """Retrieve metadata for an individual sheet, including columns and cleaning results."""
     sheet = (
         db.query(FileSheet)
@@ -759,6 +789,7 @@ async def get_sheet_detail(file_id: int, sheet_id: int, db: Session = Depends(ge
 
     columns = (
         db.query(SheetColumn)
+        .options(undefer(SheetColumn.cleaning_applied))
         .filter(SheetColumn.file_id == file_id, SheetColumn.sheet_id == sheet_id)
         .order_by(SheetColumn.column_index)
         .all()
@@ -788,7 +819,7 @@ async def get_sheet_detail(file_id: int, sheet_id: int, db: Session = Depends(ge
 
 
 @app.get("/files/{file_id}/preview", response_model=Dict[str, Any])
-async def get_file_preview(
+def get_file_preview(
     file_id: int,
     rows: int = Query(10, ge=1, le=100),
     sheet_id: Optional[int] = Query(default=None),
@@ -828,7 +859,7 @@ async def get_file_preview(
 
 
 @app.delete("/files/{file_id}", response_model=Dict[str, Any])
-async def delete_file(file_id: int, db: Session = Depends(get_db)) -> Dict[str, Any]:
+def delete_file(file_id: int, db: Session = Depends(get_db)) -> Dict[str, Any]:
     """Delete an uploaded file and associated metadata."""
     file_record = db.query(UploadedFileModel).filter(UploadedFileModel.id == file_id).first()
     if not file_record:
@@ -846,6 +877,8 @@ async def delete_file(file_id: int, db: Session = Depends(get_db)) -> Dict[str,
         db.query(QueryHistory).filter(QueryHistory.file_id == file_id).delete()
         db.delete(file_record)
         db.commit()
+        clear_table_name_cache(file_id)
+        clear_generated_sql_cache(file_id)
 
         return {
             "message": "File deleted successfully.",
@@ -859,10 +892,11 @@ async def delete_file(file_id: int, db: Session = Depends(get_db)) -> Dict[str,
 
 
 @app.get("/files/{file_id}/query-history", response_model=Dict[str, Any])
-async def get_query_history(file_id: int, db: Session = Depends(get_db)) -> Dict[str, Any]:
+def get_query_history(file_id: int, db: Session = Depends(get_db)) -> Dict[str, Any]:
     """Return recent AI query history for a file."""
     history = (
         db.query(QueryHistory)
+        .options(undefer(QueryHistory.visualization_config))
         .filter(QueryHistory.file_id == file_id)
         .order_by(QueryHistory.created_at.desc())
         .limit(100)
@@ -889,144 +923,6 @@ async def get_query_history(file_id: int, db: Session = Depends(get_db)) -> Dict
     }
 
 
-@app.post("/ai/query", response_model=Dict[str, Any])
-async def ai_query(
-    request: AIQueryRequest,
-    db: Session = Depends(get_db),
-) -> Dict[str, Any]:
-    """
-    Execute an AI-powered natural language query against a file's primary sheet.
-
-    The endpoint orchestrates SQL generation, execution, visualization recommendation,
-    and query history persistence.
-    """
-    if not request.file_id:
-        raise HTTPException(status_code=400, detail="file_id is required for AI queries.")
-
-    file_record = db.query(UploadedFileModel).filter(UploadedFileModel.id == request.file_id).first()
-    if not file_record:
-        raise HTTPException(status_code=404, detail="File not found.")
-
-    sheet_model, table_name = _resolve_primary_sheet(file_record, db)
-    gemini_service = get_gemini_service()
-
-    # Build context payload
-    context_payload: Dict[str, Any] = request.model_dump()
-    context_payload["sheet_name"] = sheet_model.sheet_name
-    context_payload["schemas"] = get_table_schema(table_name, engine)
-    context_payload["cleaning_metadata"] = (file_record.cleaning_metadata or {}).get(sheet_model.sheet_name)
-
-    session_record: Optional[ChatSession] = None
-    if request.session_id:
-        try:
-            session_record = chat_service.get_session(db, request.session_id)
-        except ValueError as exc:
-            raise HTTPException(status_code=404, detail=str(exc)) from exc
-    else:
-        session_record = chat_service.create_session(
-            db,
-            title=request.session_title,
-            file_id=file_record.id,
-            user_id=1,
-        )
-
-    user_message = chat_service.add_message(
-        db,
-        session_record,
-        role="user",
-        content=request.query,
-        user_id=1,
-    )
-
-    response_messages: List[ChatMessageResponse] = [ChatMessageResponse.model_validate(user_message)]
-
-    try:
-        start_time = datetime.utcnow()
-        ai_result = gemini_service.execute_ai_query(context_payload, table_name, engine)
-        end_time = datetime.utcnow()
-
-        if ai_result.get("status") != "completed":
-            raise HTTPException(status_code=500, detail=ai_result.get("error", "AI query failed."))
-
-        executed_results = ai_result.get("executed_results", {})
-        row_count = executed_results.get("row_count")
-
-        # Persist query history
-        history_entry = QueryHistory(
-            file_id=file_record.id,
-            natural_language_query=request.query,
-            processed_query=context_payload.get("context"),
-            sql_query=ai_result.get("sql_query"),
-            response_text=ai_result.get("explanation"),
-            visualization_type=None,
-            visualization_config=ai_result.get("visualizations"),
-            execution_time_ms=(end_time - start_time).total_seconds() * 1000.0,
-            rows_returned=row_count,
-            status=ai_result.get("status", "completed"),
-            executed_at=end_time,
-            session_id=session_record.id,
-        )
-        db.add(history_entry)
-        db.commit()
-
-        assistant_message = chat_service.add_message(
-            db,
-            session_record,
-            role="assistant",
-            content=ai_result.get("explanation") or "Analysis completed.",
-            sql_query=ai_result.get("sql_query"),
-            payload={
-                "query_id": history_entry.id,
-                "visualizations": ai_result.get("visualizations"),
-                "executed_results": executed_results,
-            },
-            user_id=1,
-        )
-        response_messages.append(ChatMessageResponse.model_validate(assistant_message))
-
-        message_count = db.query(ChatMessage.id).filter(ChatMessage.session_id == session_record.id).count()
-        assistant_preview = (
-            db.query(ChatMessage.content)
-            .filter(ChatMessage.session_id == session_record.id, ChatMessage.role == "assistant")
-            .order_by(ChatMessage.created_at.desc())
-            .limit(1)
-            .scalar()
-        )
-        session_summary = ChatSessionSummary(
-            id=session_record.id,
-            title=session_record.title,
-            summary=session_record.summary,
-            file_id=session_record.file_id,
-            is_archived=session_record.is_archived,
-            created_at=session_record.created_at,
-            updated_at=session_record.updated_at,
-            last_interaction_at=session_record.last_interaction_at,
-            message_count=message_count,
-            assistant_preview=assistant_preview,
-        )
-
-        return {
-            "status": ai_result.get("status"),
-            "query": request.query,
-            "sql_query": ai_result.get("sql_query"),
-            "executed_results": executed_results,
-            "visualizations": ai_result.get("visualizations"),
-            "explanation": ai_result.get("explanation"),
-            "data_quality_disclaimer": ai_result.get("data_quality_disclaimer"),
-            "query_id": history_entry.id,
-            "session_id": session_record.id,
-            "created_session": session_summary,
-            "messages": response_messages,
-        }
-
-    except HTTPException:
-        db.rollback()
-        raise
-    except Exception as exc:
-        db.rollback()
-        raise HTTPException(status_code=500, detail=f"AI query execution failed: {str(exc)}")
-
-
 @app.exception_handler(HTTPException)
 async def http_exception_handler(_, exc: HTTPException):
     """Return JSON error responses with FastAPI HTTPException."""
@@ -13,7 +13,9 @@ from sqlalchemy.orm import sessionmaker
 from sqlalchemy.pool import StaticPool
 
 from main import app
-from app.core.config import Base, get_db, engine as app_engine, SessionLocal
+from app.routers.ai import clear_generated_sql_cache, clear_table_name_cache
+from app.utils.database import clear_table_schema_cache
+from app.core.config import Base, get_db, get_db_ro, engine as app_engine, SessionLocal
 
 # Test database URL (in-memory SQLite for isolation)
 TEST_DATABASE_URL = "sqlite:///:memory:"
@@ -38,6 +40,7 @@ def override_get_db() -> Generator:
 
 # Apply dependency override
 app.dependency_overrides[get_db] = override_get_db
+app.dependency_overrides[get_db_ro] = override_get_db
 
 @pytest.fixture(scope="session")
 def engine():
@@ -57,12 +60,25 @@ def db_session(engine):
     transaction.rollback()
     connection.close()
 
+@pytest.fixture(autouse=True)
+def reset_table_name_cache():
+    """Keep cached file -> table lookups, table schemas and generated SQL from leaking between tests."""
+    clear_table_name_cache()
+    clear_generated_sql_cache()
+    clear_table_schema_cache()
+    yield
+    clear_table_name_cache()
+    clear_generated_sql_cache()
+    clear_table_schema_cache()
+
 @pytest.fixture
 def client():
     """Create FastAPI TestClient."""
     yield TestClient(app)
-    # Cleanup after each test
+    # Reset any per-test overrides but keep later tests on the test database
     app.dependency_overrides.clear()
+    app.dependency_overrides[get_db] = override_get_db
+    app.dependency_overrides[get_db_ro] = override_get_db
 
 @pytest.fixture
 def mock_gemini(monkeypatch):
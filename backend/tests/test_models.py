@@ -4,7 +4,7 @@ from app.models.base import UploadedFile, FileSheet, SheetColumn, DataQualityIss
 from app.models.schemas import (
     FileUploadResponse, FileProcessingStatus, SheetInfo, ColumnInfo,
     DataQualityIssueSchema, NaturalLanguageQuery, QueryResponse,
-    AIQueryRequest, AIQueryResponse, HealthCheckResponse
+    AIQueryRequest, AIQueryResponse, ExecuteSQLRequest, HealthCheckResponse
 )
 
 class TestBaseModels:
@@ -26,6 +26,22 @@ class TestBaseModels:
         assert file.status == "uploaded"
         assert file.total_sheets == 0
 
+    def test_uploaded_file_hash_stored_as_bytes(self, db_session):
+        """Test hex file hashes round-trip as raw digest bytes"""
+        digest = bytes(range(32))
+        file = UploadedFile(
+            filename="test.xlsx",
+            original_filename="original.xlsx",
+            file_path="/tmp/test.xlsx",
+            file_size=1024,
+            file_hash=digest.hex(),
+            mime_type="application/vnd.ms-excel"
+        )
+        db_session.add(file)
+        db_session.flush()
+        db_session.expire(file)
+        assert file.file_hash == digest
+
     def test_file_sheet_creation(self, db_session):
         """Test FileSheet model instantiation"""
         sheet = FileSheet(
@@ -181,6 +197,16 @@ class TestPydanticSchemas:
         )
         assert request.query == "Analyze sales data"
 
+    def test_execute_sql_request(self):
+        """Test ExecuteSQLRequest schema"""
+        request = ExecuteSQLRequest(file_id=1, sql_query="SELECT * FROM data")
+        assert request.file_id == 1
+        assert request.sql_query == "SELECT * FROM data"
+
+        empty = ExecuteSQLRequest()
+        assert empty.file_id is None
+        assert empty.sql_query is None
+
     def test_ai_query_response(self):
         """Test AIQueryResponse schema"""
         response = AIQueryResponse(
@@ -42,6 +42,31 @@ class TestAIRouter:
         assert data["status"] == "completed"
         assert data["sql_query"] == "SELECT * FROM test_table"
 
+    def test_generate_sql_etag_not_modified(self, client, db_session, mock_gemini):
+        """Test repeat SQL generation is cached and answers 304 for a matching ETag"""
+        test_file = UploadedFile(
+            filename="test.xlsx",
+            original_filename="test.xlsx",
+            file_path="/tmp/test.xlsx",
+            file_size=1024,
+            file_hash="abc123",
+            mime_type="application/vnd.ms-excel",
+            dynamic_table_name="test_table"
+        )
+        db_session.add(test_file)
+        db_session.commit()
+        db_session.refresh(test_file)
+
+        payload = {"query": "Show all data", "file_id": test_file.id}
+        with patch("app.routers.ai.get_gemini_service", return_value=mock_gemini):
+            first = client.post("/ai/generate-sql", json=payload)
+            etag = first.headers["etag"]
+            second = client.post("/ai/generate-sql", json=payload, headers={"If-None-Match": etag})
+
+        assert first.status_code == 200
+        assert second.status_code == 304
+        assert second.headers["etag"] == etag
+
     def test_generate_sql_missing_query(self, client):
         """Test SQL generation with missing query"""
         response = client.post("/ai/generate-sql", json={})
@@ -108,7 +133,7 @@ class TestAIRouter:
         db_session.refresh(test_file)
 
         # Mock execute_sql function
-        with patch('app.utils.database.execute_sql') as mock_execute:
+        with patch('app.routers.ai.execute_sql') as mock_execute:
             mock_df = MagicMock()
             mock_df.to_dict.return_value = [{"id": 1, "name": "test"}]
             mock_df.__len__ = lambda: 1
@@ -196,3 +221,361 @@ class TestAIRouter:
 
         assert response.status_code == 500
         assert "SQL generation failed" in response.json()["detail"]
+
+
+class TestChatRouter:
+    """Test chat router endpoints"""
+
+    def test_export_session_json_streams_messages(self, client, db_session):
+        """Test JSON export keeps its shape while streaming messages"""
+        from app.services.chat_service import chat_service
+
+        session = chat_service.create_session(db_session, title="Sales", user_id=1)
+        chat_service.add_exchange(
+            db_session,
+            session,
+            user_content="Show sales",
+            assistant_content="Here are the sales",
+        )
+
+        response = client.get(f"/chat/sessions/{session.id}/export")
+
+        assert response.status_code == 200
+        data = response.json()
+        assert data["session"]["message_count"] == 2
+        assert [msg["role"] for msg in data["messages"]] == ["user", "assistant"]
+
+    def test_update_assistant_message_without_lazy_loads(self, client, db_session):
+        """Test editing an assistant reply refreshes the session preview from the eagerly loaded session"""
+        from app.services.chat_service import chat_service
+
+        session = chat_service.create_session(db_session, title="Sales", user_id=1)
+        _, assistant_message, _ = chat_service.add_exchange(
+            db_session,
+            session,
+            user_content="Show sales",
+            assistant_content="Here are the sales",
+        )
+        message_id = assistant_message.id
+
+        response = client.put(f"/chat/messages/{message_id}", json={"content": "Sales by region"})
+
+        assert response.status_code == 200
+        assert response.json()["content"] == "Sales by region"
+
+    def test_update_session_returns_flushed_row(self, client, db_session):
+        """Test renaming a session answers from the flushed row rather than a post-commit reload"""
+        from app.services.chat_service import chat_service
+
+        session = chat_service.create_session(db_session, title="Sales", user_id=1)
+        session_id = session.id
+
+        response = client.put(f"/chat/sessions/{session_id}", json={"title": "Revenue"})
+
+        assert response.status_code == 200
+        data = response.json()["session"]
+        assert data["title"] == "Revenue"
+        assert data["updated_at"] is not None
+
+    def test_search_session_messages_returns_match_context(self, client, db_session):
+        """Test search snippets are cut around a case-insensitive match in the original text"""
+        from app.services.chat_service import chat_service
+
+        session = chat_service.create_session(db_session, title="Sales", user_id=1)
+        chat_service.add_exchange(
+            db_session,
+            session,
+            user_content="x" * 80 + " Quarterly SALES by region " + "y" * 80,
+            assistant_content="Totals per region",
+        )
+        session_id = session.id
+
+        response = client.get(f"/chat/sessions/{session_id}/search", params={"query": "sales"})
+
+        assert response.status_code == 200
+        (result,) = response.json()["results"]
+        assert result["match_context"] == "..." + "x" * 39 + " Quarterly SALES by region " + "y" * 39 + "..."
+
+    def test_export_session_txt_streams_transcript(self, client, db_session):
+        """Test the text export keeps its content/filename shape while streaming the transcript"""
+        from app.services.chat_service import chat_service
+
+        session = chat_service.create_session(db_session, title="Sales", user_id=1)
+        chat_service.add_exchange(
+            db_session,
+            session,
+            user_content='Show "sales"',
+            assistant_content="Here are the sales",
+            sql_query="SELECT * FROM data",
+        )
+        session_id = session.id
+
+        response = client.get(f"/chat/sessions/{session_id}/export", params={"format": "txt"})
+
+        assert response.status_code == 200
+        data = response.json()
+        assert data["filename"] == f"chat_session_{session_id}.txt"
+        lines = data["content"].split("\n")
+        assert lines[0] == "Chat Session: Sales"
+        assert lines[2] == "Messages: 2"
+        assert lines[6].endswith("] USER:")
+        assert lines[7:9] == ['Show "sales"', ""]
+        assert lines[9].endswith("] ASSISTANT:")
+        assert lines[10:] == ["Here are the sales", "SQL: SELECT * FROM data", ""]
+
+    def test_export_session_not_found(self, client):
+        """Test exporting a missing session"""
+        response = client.get("/chat/sessions/999/export")
+
+        assert response.status_code == 404
+
+    def test_create_session_unknown_file(self, client):
+        """Test creating a session for a missing file answers 404"""
+        response = client.post("/chat/sessions", json={"title": "Sales", "file_id": 999})
+
+        assert response.status_code == 404
+
+    def test_send_message_persists_exchange(self, client, db_session, mock_gemini):
+        """Test a chat turn stores the user message and AI reply together"""
+        from app.models.base import ChatMessage
+
+        test_file = UploadedFile(
+            filename="test.xlsx",
+            original_filename="test.xlsx",
+            file_path="/tmp/test.xlsx",
+            file_size=1024,
+            file_hash="abc123",
+            mime_type="application/vnd.ms-excel",
+            dynamic_table_name="test_table"
+        )
+        db_session.add(test_file)
+        db_session.commit()
+
+        with patch("app.routers.chat.get_gemini_service", return_value=mock_gemini):
+            response = client.post("/chat/send-message", json={
+                "query": "Show all data",
+                "file_id": test_file.id
+            })
+
+        assert response.status_code == 200
+        data = response.json()
+        assert [msg["role"] for msg in data["messages"]] == ["user", "assistant"]
+        assert db_session.query(ChatMessage).filter(ChatMessage.session_id == data["session_id"]).count() == 2
+
+    def test_send_message_unprocessed_file(self, client, db_session):
+        """Test a chat turn against a file without a dynamic table is rejected before calling the AI"""
+        test_file = UploadedFile(
+            filename="test.xlsx",
+            original_filename="test.xlsx",
+            file_path="/tmp/test.xlsx",
+            file_size=1024,
+            file_hash="abc123",
+            mime_type="application/vnd.ms-excel"
+        )
+        db_session.add(test_file)
+        db_session.commit()
+        file_id = test_file.id
+
+        response = client.post("/chat/send-message", json={"query": "Show all data", "file_id": file_id})
+
+        assert response.status_code == 404
+        assert response.json()["detail"] == "File not found or not processed"
+
+    def test_send_message_stream_emits_stages_then_done(self, client, db_session):
+        """Test the SSE endpoint relays pipeline stages and finishes with the saved turn"""
+        test_file = UploadedFile(
+            filename="test.xlsx",
+            original_filename="test.xlsx",
+            file_path="/tmp/test.xlsx",
+            file_size=1024,
+            file_hash="abc123",
+            mime_type="application/vnd.ms-excel",
+            dynamic_table_name="test_table"
+        )
+        db_session.add(test_file)
+        db_session.commit()
+
+        mock_service = MagicMock()
+        mock_service.stream_ai_query.return_value = iter([
+            ("sql", {"sql_query": "SELECT * FROM test_table"}),
+            ("completed", {"status": "completed", "sql_query": "SELECT * FROM test_table", "explanation": "Done"}),
+        ])
+
+        with patch("app.routers.chat.get_gemini_service", return_value=mock_service):
+            response = client.post("/chat/send-message/stream", json={
+                "query": "Show all data",
+                "file_id": test_file.id
+            })
+
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/event-stream")
+        events = [block.split("\n") for block in response.text.strip().split("\n\n")]
+        assert [lines[0] for lines in events] == ["event: sql", "event: done"]
+        assert '"explanation":"Done"' in events[1][1]
+
+    def test_get_session_messages(self, client, db_session):
+        """Test listing messages keeps the ChatMessageListResponse shape"""
+        from app.services.chat_service import chat_service
+
+        session = chat_service.create_session(db_session, title="Sales", user_id=1)
+        chat_service.add_exchange(
+            db_session,
+            session,
+            user_content="Show sales",
+            assistant_content="Here are the sales",
+            payload={"visualizations": []},
+        )
+
+        response = client.get(f"/chat/sessions/{session.id}/messages")
+
+        assert response.status_code == 200
+        data = response.json()
+        assert data["session_id"] == session.id
+        assert [msg["content"] for msg in data["messages"]] == ["Show sales", "Here are the sales"]
+        assert data["messages"][1]["payload"] == {"visualizations": []}
+        assert set(data["messages"][0]) == {"id", "session_id", "role", "content", "sql_query", "payload", "created_at"}
+
+    def test_get_session_messages_first_page_cursor(self, client, db_session):
+        """Test a full default first page returns a cursor to the newer messages after it"""
+        from app.routers.chat import _decode_message_cursor
+        from app.services.chat_service import chat_service
+
+        session = chat_service.create_session(db_session, title="Sales", user_id=1)
+        for turn in range(2):
+            chat_service.add_exchange(
+                db_session,
+                session,
+                user_content=f"Question {turn}",
+                assistant_content=f"Answer {turn}",
+            )
+        session_id = session.id
+        messages = chat_service.list_messages(db_session, session_id)
+        expected_next = (messages[1].created_at, messages[1].id, True)
+
+        response = client.get(f"/chat/sessions/{session_id}/messages", params={"limit": 2})
+
+        assert response.status_code == 200
+        data = response.json()
+        assert [msg["content"] for msg in data["messages"]] == ["Question 0", "Answer 0"]
+        assert _decode_message_cursor(data["next_cursor"]) == expected_next
+
+    def test_get_session_messages_cursor_pages(self, client, db_session):
+        """Test a cursor returns the page just older than its message, plus the next cursor"""
+        from app.routers.chat import _decode_message_cursor, _encode_message_cursor
+        from app.services.chat_service import chat_service
+
+        session = chat_service.create_session(db_session, title="Sales", user_id=1)
+        for turn in range(3):
+            chat_service.add_exchange(
+                db_session,
+                session,
+                user_content=f"Question {turn}",
+                assistant_content=f"Answer {turn}",
+            )
+        session_id = session.id
+        messages = chat_service.list_messages(db_session, session_id)
+        cursor = _encode_message_cursor(messages[4])
+        expected_next = (messages[2].created_at, messages[2].id)
+
+        response = client.get(f"/chat/sessions/{session_id}/messages", params={"limit": 2, "cursor": cursor})
+
+        assert response.status_code == 200
+        data = response.json()
+        assert [msg["content"] for msg in data["messages"]] == ["Question 1", "Answer 1"]
+        assert _decode_message_cursor(data["next_cursor"]) == (*expected_next, False)
+
+    def test_get_session_messages_forward_cursor_pages(self, client, db_session):
+        """Test a forward cursor returns the page just newer than its message, plus a forward next cursor"""
+        from app.routers.chat import _decode_message_cursor, _encode_message_cursor
+        from app.services.chat_service import chat_service
+
+        session = chat_service.create_session(db_session, title="Sales", user_id=1)
+        for turn in range(3):
+            chat_service.add_exchange(
+                db_session,
+                session,
+                user_content=f"Question {turn}",
+                assistant_content=f"Answer {turn}",
+            )
+        session_id = session.id
+        messages = chat_service.list_messages(db_session, session_id)
+        cursor = _encode_message_cursor(messages[1], forward=True)
+        expected_next = (messages[3].created_at, messages[3].id, True)
+
+        response = client.get(f"/chat/sessions/{session_id}/messages", params={"limit": 2, "cursor": cursor})
+
+        assert response.status_code == 200
+        data = response.json()
+        assert [msg["content"] for msg in data["messages"]] == ["Question 1", "Answer 1"]
+        assert _decode_message_cursor(data["next_cursor"]) == expected_next
+
+    def test_get_session_messages_invalid_cursor(self, client, db_session):
+        """Test a malformed cursor is rejected"""
+        from app.services.chat_service import chat_service
+
+        session = chat_service.create_session(db_session, title="Sales", user_id=1)
+
+        response = client.get(f"/chat/sessions/{session.id}/messages", params={"cursor": "not-a-cursor"})
+
+        assert response.status_code == 400
+
+    def test_list_sessions(self, client, db_session):
+        """Test session listing returns summaries with counts and previews"""
+        from app.services.chat_service import chat_service
+
+        session = chat_service.create_session(db_session, title="Sales", user_id=1)
+        chat_service.add_exchange(
+            db_session,
+            session,
+            user_content="Show sales",
+            assistant_content="Here are the sales",
+        )
+        session_id = session.id
+
+        response = client.get("/chat/sessions")
+
+        assert response.status_code == 200
+        summary = next(item for item in response.json()["sessions"] if item["id"] == session_id)
+        assert summary["message_count"] == 2
+        assert summary["assistant_preview"] == "Here are the sales"
+
+    def test_send_message_reuses_cached_ai_response(self, client, db_session):
+        """Test a repeated question about the same file skips the model call"""
+        from app.routers.ai import ai_response_cache_key, cache_ai_response
+
+        test_file = UploadedFile(
+            filename="test.xlsx",
+            original_filename="test.xlsx",
+            file_path="/tmp/test.xlsx",
+            file_size=1024,
+            file_hash="abc123",
+            mime_type="application/vnd.ms-excel",
+            dynamic_table_name="test_table"
+        )
+        db_session.add(test_file)
+        db_session.commit()
+        cache_ai_response(
+            ai_response_cache_key(test_file.id, "test_table", "Show  all data"),
+            test_file.id,
+            {"status": "completed", "sql_query": "SELECT * FROM test_table", "explanation": "Cached explanation"},
+        )
+
+        with patch("app.routers.chat.get_gemini_service") as mock_get_service:
+            response = client.post("/chat/send-message", json={
+                "query": "Show all data?",
+                "file_id": test_file.id
+            })
+
+        assert response.status_code == 200
+        assert response.json()["explanation"] == "Cached explanation"
+        mock_get_service.assert_not_called()
+
+    def test_cached_ai_response_expires(self, monkeypatch):
+        """Test cached AI responses are dropped once older than the TTL"""
+        from app.routers import ai
+
+        ai.cache_ai_response('"key"', 1, {"status": "completed"})
+        assert ai.get_cached_ai_response('"key"') == {"status": "completed"}
+
+        monkeypatch.setattr(ai, "GENERATED_SQL_CACHE_TTL_SECONDS", -1)
+        assert ai.get_cached_ai_response('"key"') is None
@@ -168,6 +168,14 @@ class TestSQLGenerator:
         # Should generate at most 3 visualizations
         assert len(viz) <= 3
 
+    def test_bound_context_keeps_recent_tail(self):
+        """Test long context is cut to the token budget, keeping the latest part"""
+        from app.services.sql_generator import _bound_context
+
+        assert _bound_context(None) == ""
+        assert _bound_context("short context") == "short context"
+        assert _bound_context("old " * 10 + "latest", max_tokens=2) == "d latest"
+
 class TestDataCleaner:
     """Test DataCleaner service"""
 
@@ -206,3 +214,329 @@ class TestDataCleaner:
         # Should handle duplicates appropriately
         assert isinstance(cleaned_df, pd.DataFrame)
         assert "duplicates_removed" in metadata or "issues" in metadata
+
+    def test_clean_converts_mostly_numeric_and_datetime_columns(self):
+        """Test object columns become numeric or datetime only past their thresholds"""
+        df = pd.DataFrame({
+            'amount': ['1', '2', '3', '4', '5', '6', '7', '8', '9', 'n/a'],
+            'day': ['2024-01-0%d' % i for i in range(1, 10)] + ['soon'],
+            'label': ['a', 'b', 'c', 'd', 'e', 'f', 'g', 'h', 'i', 'j'],
+        })
+
+        cleaned_df, metadata = data_cleaner.clean(df)
+
+        assert pd.api.types.is_numeric_dtype(cleaned_df['amount'])
+        assert pd.api.types.is_datetime64_any_dtype(cleaned_df['day'])
+        assert cleaned_df['label'].dtype == object
+        assert metadata['metrics']['numeric_conversions'] == 9
+        assert metadata['cleaning_steps'][:2] == [
+            "Converted column 'amount' to numeric",
+            "Converted column 'day' to datetime",
+        ]
+
+    def test_clean_parses_text_columns_for_dates_once(self, monkeypatch):
+        """Test the date pass reuses the type pass's parse for a column left unchanged"""
+        df = pd.DataFrame({'note': ['2024-01-01', 'w', 'x', 'y', 'z']})
+        calls = []
+        to_datetime = pd.to_datetime
+
+        def counting_to_datetime(*args, **kwargs):
+            calls.append(args)
+            return to_datetime(*args, **kwargs)
+
+        monkeypatch.setattr(pd, 'to_datetime', counting_to_datetime)
+        cleaned_df, metadata = data_cleaner.clean(df)
+
+        assert len(calls) == 1
+        assert pd.api.types.is_datetime64_any_dtype(cleaned_df['note'])
+        assert metadata['metrics']['datetime_conversions'] == 1
+
+    def test_clean_reparses_text_columns_changed_since_type_pass(self, monkeypatch):
+        """Test a column whose missing values were filled is parsed again rather than patched from the cache"""
+        df = pd.DataFrame({'note': ['2024-01-01', None, 'x', 'y', 'z']})
+        calls = []
+        to_datetime = pd.to_datetime
+
+        def counting_to_datetime(*args, **kwargs):
+            calls.append(args)
+            return to_datetime(*args, **kwargs)
+
+        monkeypatch.setattr(pd, 'to_datetime', counting_to_datetime)
+        cleaned_df, metadata = data_cleaner.clean(df)
+
+        assert len(calls) == 2
+        assert pd.api.types.is_datetime64_any_dtype(cleaned_df['note'])
+        # The original date plus the missing value filled with it
+        assert metadata['metrics']['datetime_conversions'] == 2
+
+    def test_clean_trims_text_values(self):
+        """Test whitespace is trimmed from text cells, counting just the cells that changed"""
+        df = pd.DataFrame({'name': [' alice ', 'bob', ' carol', 'dave ', 'erin', 'frank']})
+
+        cleaned_df, metadata = data_cleaner.clean(df)
+
+        assert cleaned_df['name'].tolist() == ['alice', 'bob', 'carol', 'dave', 'erin', 'frank']
+        assert metadata['metrics']['text_standardized'] == 3
+
+    def test_clean_leaves_input_unchanged(self):
+        """Test cleaning works on a shallow copy without writing into the caller's frame"""
+        df = pd.DataFrame({
+            'amount': ['1', '2', None, '4'],
+            'name': [' a', 'b ', 'c', None],
+            'score': [1.0, None, 3.0, 4.0],
+        })
+        original = df.copy()
+
+        data_cleaner.clean(df)
+
+        pd.testing.assert_frame_equal(df, original)
+
+    def test_clean_fills_by_column_kind_and_drops_other_missing_rows(self):
+        """Test numeric gaps get the median, text gaps the mode, and other gaps drop the row"""
+        df = pd.DataFrame({
+            'amount': [1.0, None, 3.0, 10.0],
+            'region': ['north', None, 'north', 'south'],
+            'when': pd.to_datetime(['2024-01-01', '2024-01-02', None, '2024-01-04']),
+        })
+
+        cleaned_df, metadata = data_cleaner.clean(df)
+
+        assert cleaned_df['amount'].tolist() == [1.0, 3.0, 10.0]
+        assert cleaned_df['region'].tolist() == ['north', 'north', 'south']
+        assert metadata['metrics']['filled_null_values'] == 2
+        assert metadata['metrics']['rows_dropped'] == 1
+
+class TestChatService:
+    """Test ChatService"""
+
+    def test_add_exchange_persists_pair_and_history(self, db_session):
+        """Test that a user/assistant pair and its history row are written together"""
+        from app.models.base import ChatMessage, QueryHistory
+        from app.services.chat_service import chat_service
+
+        session = chat_service.create_session(db_session, title="Sales", user_id=1)
+
+        user_message, assistant_message, query_id = chat_service.add_exchange(
+            db_session,
+            session,
+            user_content="Show sales",
+            assistant_content="Here are the sales",
+            sql_query="SELECT * FROM data",
+            payload={"visualizations": []},
+            user_id=1,
+            history={"file_id": 1, "natural_language_query": "Show sales"},
+        )
+
+        assert user_message.role == "user"
+        assert assistant_message.role == "assistant"
+        assert assistant_message.payload["query_id"] == query_id
+        assert db_session.get(QueryHistory, query_id).session_id == session.id
+        assert db_session.query(ChatMessage).filter(ChatMessage.session_id == session.id).count() == 2
+        assert session.summary == "Show sales"
+
+    def test_session_metrics_batches_counts_and_previews(self, db_session):
+        """Test message counts and assistant previews for several sessions at once"""
+        from app.services.chat_service import chat_service
+
+        busy = chat_service.create_session(db_session, title="Busy", user_id=1)
+        empty = chat_service.create_session(db_session, title="Empty", user_id=1)
+        chat_service.add_exchange(
+            db_session,
+            busy,
+            user_content="Show sales",
+            assistant_content="Here are the sales",
+        )
+
+        counts, previews = chat_service.session_metrics(db_session, [busy.id, empty.id])
+
+        assert counts == {busy.id: 2}
+        assert previews == {busy.id: "Here are the sales"}
+        assert chat_service.session_metrics(db_session, []) == ({}, {})
+
+    def test_session_metrics_aggregate_path_matches_inline(self, db_session, monkeypatch):
+        """Test the GROUP BY/window path returns the same metrics as the inline scan"""
+        import sys
+        from app.services.chat_service import chat_service
+
+        # The package re-exports the instance under the module's name, so look the module up directly
+        chat_service_module = sys.modules["app.services.chat_service"]
+
+        session = chat_service.create_session(db_session, title="Sales", user_id=1)
+        chat_service.add_exchange(db_session, session, user_content="Q1", assistant_content="A1")
+
+        inline = chat_service.session_metrics(db_session, [session.id])
+        monkeypatch.setattr(chat_service_module, "INLINE_METRICS_SESSION_LIMIT", 0)
+        aggregated = chat_service.session_metrics(db_session, [session.id])
+
+        assert inline == aggregated == ({session.id: 2}, {session.id: "A1"})
+
+    def test_list_messages_keyset_before_id(self, db_session):
+        """Test paging backwards from a message returns the older page in chronological order"""
+        from app.services.chat_service import chat_service
+
+        session = chat_service.create_session(db_session, title="Sales", user_id=1)
+        chat_service.add_exchange(db_session, session, user_content="Q1", assistant_content="A1")
+        _, latest, _ = chat_service.add_exchange(db_session, session, user_content="Q2", assistant_content="A2")
+
+        page = chat_service.list_messages(db_session, session.id, limit=2, before_id=latest.id)
+
+        assert [message.content for message in page] == ["A1", "Q2"]
+
+    def test_list_messages_keyset_after_id(self, db_session):
+        """Test paging forwards from a message returns only the newer messages"""
+        from app.services.chat_service import chat_service
+
+        session = chat_service.create_session(db_session, title="Sales", user_id=1)
+        _, first_reply, _ = chat_service.add_exchange(db_session, session, user_content="Q1", assistant_content="A1")
+        chat_service.add_exchange(db_session, session, user_content="Q2", assistant_content="A2")
+
+        page = chat_service.list_messages(db_session, session.id, after_id=first_reply.id)
+
+        assert [message.content for message in page] == ["Q2", "A2"]
+
+    def test_session_metrics_truncates_preview_in_sql(self, db_session):
+        """Test previews are cut to a short prefix before leaving the database"""
+        from app.services.chat_service import PREVIEW_FETCH_LENGTH, chat_service
+
+        session = chat_service.create_session(db_session, title="Sales", user_id=1)
+        chat_service.add_exchange(db_session, session, user_content="Q", assistant_content="x" * 500)
+
+        _, previews = chat_service.session_metrics(db_session, [session.id])
+
+        assert previews[session.id] == "x" * PREVIEW_FETCH_LENGTH
+
+    def test_session_stats_denormalized_on_write(self, db_session):
+        """Test message count and preview are kept on the session as messages change"""
+        from app.services.chat_service import chat_service
+
+        session = chat_service.create_session(db_session, title="Sales", user_id=1)
+        assert session.message_count == 0
+
+        _, assistant_message, _ = chat_service.add_exchange(
+            db_session, session, user_content="Q1", assistant_content="A1"
+        )
+        chat_service.add_message(db_session, session, role="user", content="Q2")
+        assert session.message_count == 3
+        assert session.assistant_preview == "A1"
+
+        db_session.delete(assistant_message)
+        chat_service.refresh_session_metrics(db_session, session)
+        assert session.message_count == 2
+        assert session.assistant_preview is None
+
+    def test_delete_session_removes_messages_without_lazy_loads(self, db_session):
+        """Test a fetched session refuses lazy loads and still deletes with its messages"""
+        import sqlalchemy.exc
+        from app.models.base import ChatMessage, ChatSession, QueryHistory
+        from app.services.chat_service import chat_service
+
+        created = chat_service.create_session(db_session, title="Sales", user_id=1)
+        _, _, query_id = chat_service.add_exchange(
+            db_session,
+            created,
+            user_content="Show sales",
+            assistant_content="Here are the sales",
+            history={"file_id": 1, "natural_language_query": "Show sales"},
+        )
+        session_id = created.id
+        db_session.expunge_all()
+
+        session = chat_service.get_session(db_session, session_id)
+        with pytest.raises(sqlalchemy.exc.InvalidRequestError):
+            session.messages
+
+        chat_service.delete_session(db_session, session)
+
+        assert db_session.get(ChatSession, session_id) is None
+        assert db_session.query(ChatMessage).filter(ChatMessage.session_id == session_id).count() == 0
+        assert db_session.get(QueryHistory, query_id).session_id is None
+
+    def test_search_messages_uses_index_and_tracks_edits(self, db_session):
+        """Test substring search finds content and SQL, and follows message edits and deletes"""
+        from app.models.base import ChatMessage
+        from app.services.chat_service import chat_service
+
+        session = chat_service.create_session(db_session, title="Sales", user_id=1)
+        user_message, reply, _ = chat_service.add_exchange(
+            db_session,
+            session,
+            user_content="Show SALES by region",
+            assistant_content="Totals per region",
+            sql_query="SELECT region, SUM(amount) FROM data GROUP BY region",
+        )
+
+        assert {m.id for m in chat_service.search_messages(db_session, session.id, "sales")} == {user_message.id}
+        assert [m.id for m in chat_service.search_messages(db_session, session.id, "sum(amount)")] == [reply.id]
+        assert {m.id for m in chat_service.search_messages(db_session, session.id, "re")} == {user_message.id, reply.id}
+
+        reply.content = "Revenue per region"
+        db_session.commit()
+        assert [m.id for m in chat_service.search_messages(db_session, session.id, "revenue")] == [reply.id]
+
+        db_session.delete(db_session.get(ChatMessage, user_message.id))
+        db_session.commit()
+        assert chat_service.search_messages(db_session, session.id, "sales") == []
+
+    @pytest.mark.parametrize("inline_limit", [20, 0])
+    def test_session_metrics_prefers_latest_same_second_reply(self, db_session, monkeypatch, inline_limit):
+        """Test both metrics paths pick the newest assistant reply when timestamps tie"""
+        import sys
+        from app.services.chat_service import chat_service
+
+        chat_service_module = sys.modules["app.services.chat_service"]
+
+        session = chat_service.create_session(db_session, title="Sales", user_id=1)
+        chat_service.add_exchange(db_session, session, user_content="Q1", assistant_content="first")
+        chat_service.add_exchange(db_session, session, user_content="Q2", assistant_content="second")
+        monkeypatch.setattr(chat_service_module, "INLINE_METRICS_SESSION_LIMIT", inline_limit)
+
+        counts, previews = chat_service.session_metrics(db_session, [session.id])
+
+        assert counts[session.id] == 4
+        assert previews[session.id] == "second"
+
+    def test_list_sessions_reads_stored_stats(self, db_session):
+        """Test sessions come back with stored counts, falling back to aggregates for un-backfilled rows"""
+        from app.services.chat_service import chat_service
+
+        stored = chat_service.create_session(db_session, title="Stored", user_id=1)
+        chat_service.add_exchange(db_session, stored, user_content="Hi", assistant_content="Hello there")
+        legacy = chat_service.create_session(db_session, title="Legacy", user_id=1)
+        chat_service.add_exchange(db_session, legacy, user_content="Hi", assistant_content="Old reply")
+        legacy.message_count = None
+        archived = chat_service.create_session(db_session, title="Archived", user_id=1)
+        archived.is_archived = True
+        db_session.commit()
+
+        listed = {session.id: (count, preview) for session, count, preview in chat_service.list_sessions(db_session)}
+        with_archived = {session.id for session, _, _ in chat_service.list_sessions(db_session, include_archived=True)}
+
+        assert listed[stored.id] == (2, "Hello there")
+        assert listed[legacy.id] == (2, "Old reply")
+        assert archived.id not in listed
+        assert archived.id in with_archived
+
+    def test_add_feedback_appends_in_place(self, db_session):
+        """Test feedback is appended in SQL without dropping the rest of the payload"""
+        from app.services.chat_service import chat_service
+
+        session = chat_service.create_session(db_session, title="Sales", user_id=1)
+        user_message, reply, _ = chat_service.add_exchange(
+            db_session,
+            session,
+            user_content="Show sales",
+            assistant_content="Here are the sales",
+            payload={"executed_results": [{"region": "EU", "total": 10}]},
+        )
+
+        assert chat_service.add_feedback(db_session, reply.id, {"type": "thumbs_up"}) == 1
+        assert chat_service.add_feedback(db_session, reply.id, {"type": "helpful"}) == 2
+        assert chat_service.add_feedback(db_session, user_message.id, {"type": "thumbs_down"}) == 1
+        assert chat_service.add_feedback(db_session, 999, {"type": "thumbs_up"}) is None
+
+        db_session.expire_all()
+        assert reply.payload == {
+            "executed_results": [{"region": "EU", "total": 10}],
+            "feedback": [{"type": "thumbs_up"}, {"type": "helpful"}],
+        }
+        assert user_message.payload == {"feedback": [{"type": "thumbs_down"}]}
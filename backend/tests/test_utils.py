@@ -5,9 +5,12 @@ import os
 from unittest.mock import patch, MagicMock
 from app.utils.database import (
     DynamicTableManager, create_dynamic_table_from_schema,
-    insert_dataframe_to_table, get_table_schema, execute_sql, table_manager
+    insert_dataframe_to_table, get_table_schema, execute_sql, table_manager,
+    clear_table_schema_cache
 )
 from app.utils.init_db import create_tables, drop_tables
+from app.utils.retry import retry_on_sqlite_busy
+from sqlalchemy.exc import OperationalError
 
 class TestDynamicTableManager:
     """Test DynamicTableManager class"""
@@ -138,6 +141,24 @@ class TestDatabaseFunctions:
             assert call_args[1]['if_exists'] == 'append'
             assert call_args[1]['index'] == False
 
+    def test_table_helpers_join_caller_transaction(self):
+        """Test a Connection argument keeps the new table and its rows inside the caller's transaction"""
+        from sqlalchemy import create_engine, event, inspect
+
+        engine = create_engine("sqlite://")
+        # Emit BEGIN ourselves, as the app's write engine does, so pysqlite keeps DDL in the transaction
+        event.listen(engine, "connect", lambda dbapi_conn, _: setattr(dbapi_conn, "isolation_level", None))
+        event.listen(engine, "begin", lambda conn: conn.exec_driver_sql("BEGIN"))
+        schema = {'table_name': 'joined_table', 'columns': [{'name': 'name', 'type': 'TEXT'}]}
+        df = pd.DataFrame({'name': ['x', 'y']})
+
+        with engine.connect() as conn:
+            conn.begin()
+            create_dynamic_table_from_schema(schema, conn)
+            assert insert_dataframe_to_table(df, 'joined_table', conn, file_id=1) == 2
+            conn.rollback()
+            assert 'joined_table' not in inspect(conn).get_table_names()
+
     @patch('app.utils.database.engine')
     def test_get_table_schema(self, mock_engine):
         """Test getting table schema"""
@@ -158,6 +179,20 @@ class TestDatabaseFunctions:
         assert schema['name'] == 'TEXT'
         assert 'id' not in schema  # Should skip metadata columns
 
+    def test_get_table_schema_cached_until_cleared(self):
+        """Test repeat schema lookups skip PRAGMA until the table's cache entry is cleared"""
+        mock_engine = MagicMock()
+        mock_conn = mock_engine.connect.return_value.__enter__.return_value
+        mock_conn.exec_driver_sql.side_effect = lambda sql: [(2, 'name', 'TEXT', 0, None, 0)]
+
+        assert get_table_schema('cached_table', mock_engine) == {'name': 'TEXT'}
+        assert get_table_schema('cached_table', mock_engine) == {'name': 'TEXT'}
+        assert mock_conn.exec_driver_sql.call_count == 1
+
+        clear_table_schema_cache('cached_table')
+        get_table_schema('cached_table', mock_engine)
+        assert mock_conn.exec_driver_sql.call_count == 2
+
     @patch('app.utils.database.engine')
     @patch('pandas.read_sql')
     def test_execute_sql(self, mock_read_sql, mock_engine):
@@ -169,6 +204,62 @@ class TestDatabaseFunctions:
         assert len(result) == 3
         mock_read_sql.assert_called_once_with('SELECT * FROM test_table LIMIT 200', mock_engine)
 
+    @patch('pandas.read_sql')
+    def test_execute_sql_chunked(self, mock_read_sql):
+        """Test SQL execution returning DataFrame chunks"""
+        mock_engine = MagicMock()
+        chunks = iter([pd.DataFrame({'result': [1, 2]}), pd.DataFrame({'result': [3]})])
+        mock_read_sql.return_value = chunks
+
+        result = execute_sql('test_table', 'SELECT * FROM data', mock_engine, chunksize=2)
+        assert result is chunks
+        mock_read_sql.assert_called_once_with('SELECT * FROM test_table LIMIT 200', mock_engine, chunksize=2)
+
+class TestRetryOnSqliteBusy:
+    """Test retry_on_sqlite_busy decorator"""
+
+    @patch('app.utils.retry.time.sleep')
+    def test_retries_locked_database(self, mock_sleep):
+        """Test that lock errors are retried until the call succeeds"""
+        calls = {"count": 0}
+
+        @retry_on_sqlite_busy(max_attempts=3)
+        def flaky():
+            calls["count"] += 1
+            if calls["count"] < 3:
+                raise OperationalError("SELECT 1", {}, Exception("database is locked"))
+            return "ok"
+
+        assert flaky() == "ok"
+        assert calls["count"] == 3
+        assert mock_sleep.call_count == 2
+
+    @patch('app.utils.retry.time.sleep')
+    def test_gives_up_after_max_attempts(self, mock_sleep):
+        """Test that the last lock error is re-raised"""
+        @retry_on_sqlite_busy(max_attempts=2)
+        def always_locked():
+            raise OperationalError("SELECT 1", {}, Exception("database is locked"))
+
+        with pytest.raises(OperationalError):
+            always_locked()
+        assert mock_sleep.call_count == 1
+
+    @patch('app.utils.retry.time.sleep')
+    def test_does_not_retry_other_errors(self, mock_sleep):
+        """Test that read-only and other errors fail immediately"""
+        calls = {"count": 0}
+
+        @retry_on_sqlite_busy(max_attempts=3)
+        def readonly():
+            calls["count"] += 1
+            raise OperationalError("INSERT", {}, Exception("attempt to write a readonly database"))
+
+        with pytest.raises(OperationalError):
+            readonly()
+        assert calls["count"] == 1
+        mock_sleep.assert_not_called()
+
 class TestInitDB:
     """Test database initialization functions"""
 
@@ -192,6 +283,30 @@ class TestInitDB:
         result = create_tables()
         assert result is False
 
+    def test_convert_legacy_file_hashes(self):
+        """Test hex text hashes from older rows are read as bytes and rewritten as raw digests"""
+        from sqlalchemy import create_engine, select, text
+        from app.core.config import Base
+        from app.models.base import UploadedFile
+        from app.utils.init_db import convert_legacy_file_hashes
+
+        engine = create_engine("sqlite://")
+        Base.metadata.create_all(engine)
+        digest = bytes(range(32))
+        with engine.begin() as conn:
+            conn.execute(text(
+                "INSERT INTO uploaded_files (filename, original_filename, file_path, file_size, file_hash, mime_type) "
+                "VALUES ('a.xlsx', 'a.xlsx', 'uploads/a.xlsx', 1, :file_hash, 'application/vnd.ms-excel')"
+            ), {"file_hash": digest.hex()})
+            assert conn.scalar(select(UploadedFile.file_hash)) == digest
+
+        with patch('app.utils.init_db.engine', engine):
+            convert_legacy_file_hashes()
+
+        with engine.connect() as conn:
+            assert conn.scalar(text("SELECT typeof(file_hash) FROM uploaded_files")) == "blob"
+            assert conn.scalar(select(UploadedFile.file_hash)) == digest
+
     @patch('app.utils.init_db.Base.metadata.drop_all')
     def test_drop_tables_success(self, mock_base_drop):
         """Test successful table dropping"""
@@ -267,6 +267,7 @@ export interface ChatSessionCreateRequest {
 export interface ChatMessageListResponse {
   session_id: number;
   messages: ChatMessageResponse[];
+  next_cursor?: string | null;
 }
 
 export interface ChatSessionUpdateRequest {
@@ -492,8 +493,24 @@ class ApiService {
     });
   }
 
-  async listChatMessages(sessionId: number, limit = 200, offset = 0): Promise<ChatMessageListResponse> {
+  async listChatMessages(
+    sessionId: number,
+    limit = 200,
+    offset = 0,
+    beforeId?: number,
+    cursor?: string,
+    afterId?: number,
+  ): Promise<ChatMessageListResponse> {
     const params = new URLSearchParams({ limit: String(limit), offset: String(offset) });
+    if (beforeId !== undefined) {
+      params.set('before_id', String(beforeId));
+    }
+    if (cursor !== undefined) {
+      params.set('cursor', cursor);
+    }
+    if (afterId !== undefined) {
+      params.set('after_id', String(afterId));
+    }
     return this.request<ChatMessageListResponse>(`/chat/sessions/${sessionId}/messages?${params.toString()}`);
   }
 